@@ -0,0 +1,143 @@
+import re
+from collections import defaultdict
+from datetime import datetime
+from classes import TransactionSource
+
+SELECTOR = re.compile(r"(\*|[\w-]+)(?:\.([\w-]+))?(?:#(\S+))?")
+
+
+# one element selector: tag, tag.class or tag#id, where the id is a regex the whole id must match
+class Selector:
+    def __init__(self, text):
+        match = SELECTOR.fullmatch(text)
+        if not match:
+            raise ValueError(f"{text} is not a valid selector")
+        self.tag, self.classname, id_pattern = match.groups()
+        self.id = re.compile(id_pattern) if id_pattern else None
+
+    def matches(self, tag, classes, element_id):
+        return (self.tag == "*" or self.tag == tag) \
+            and (self.classname is None or self.classname in classes) \
+            and (self.id is None or (element_id is not None and self.id.fullmatch(element_id) is not None))
+
+
+# how one bank lays out its html statement. rows are the elements matching the row selector inside each
+# container (only row_depth levels below it, when set), and each field is the text of the first element in
+# the row matching that field's selector. the date is the date fields joined with spaces and read with
+# date_format, taking the statement's year when the format has none. spend_sign is the sign charges carry;
+# rows with the other sign (payments, refunds) are dropped
+class BankAdapter:
+    def __init__(self, source, container, row, fields, date_format, date_fields=("date",), row_depth=None, spend_sign=1):
+        self.source = source
+        self.container = Selector(container)
+        self.row = Selector(row)
+        self.row_depth = row_depth
+        self.selectors = {name: Selector(selector) for name, selector in fields.items()}
+        self.date_fields = date_fields
+        self.spend_sign = spend_sign
+        self.has_year = "%y" in date_format or "%Y" in date_format
+        self.date_format = date_format if self.has_year else f"{date_format} %Y"
+
+        # field selectors bucketed by tag, so each element in a row is only tested against those that could match it
+        self.by_tag = defaultdict(list)
+        for name, selector in self.selectors.items():
+            self.by_tag[selector.tag].append((name, selector))
+        self.any_tag = self.by_tag.pop("*", [])
+
+    # names of the fields an element holds
+    def field_names(self, tag, classes, element_id):
+        for name, selector in self.by_tag.get(tag, []) + self.any_tag:
+            if selector.matches(tag, classes, element_id):
+                yield name
+
+
+    # ------------ STREAMING ------------
+    # RowStreamer callbacks, given a tag name and its attributes as strings
+    def is_container(self, tag, attrs):
+        return self.container.matches(tag, (attrs.get("class") or "").split(), attrs.get("id"))
+
+    def is_row(self, tag, attrs, depth):
+        return (self.row_depth is None or depth == self.row_depth) \
+            and self.row.matches(tag, (attrs.get("class") or "").split(), attrs.get("id"))
+
+
+    # ------------ PARSED TREE ------------
+    # row elements of a parsed statement
+    def find_rows(self, soup):
+        for container in soup.find_all(lambda tag: self.container.matches(tag.name, tag.get("class") or [], tag.get("id"))):
+            elements = self.at_depth(container, self.row_depth) if self.row_depth else container.find_all(True)
+            for element in elements:
+                if self.row.matches(element.name, element.get("class") or [], element.get("id")):
+                    yield element
+
+    def at_depth(self, element, depth):
+        if depth == 0:
+            yield element
+            return
+        for child in element.children:
+            if child.name:
+                yield from self.at_depth(child, depth - 1)
+
+    # {field: text} for a parsed row, read in one walk over its elements
+    def read_row(self, row):
+        found = {}
+        for element in row.descendants:
+            if element.name is None:
+                continue
+            for name in self.field_names(element.name, element.get("class") or [], element.get("id")):
+                if name not in found:
+                    found[name] = element.get_text().strip()
+            if len(found) == len(self.selectors):
+                break
+        return found
+
+
+    # ((month, year), (date, desc, category, amount, source)) for a row's fields, or None when the row is not
+    # a settled charge (pending, a payment or refund) or a field is missing or unreadable
+    def parse(self, fields, year):
+        if not all(fields.get(name) for name in self.selectors):
+            return None
+        try:
+            amount = self.spend_sign * float(fields["amount"].replace("$", "").replace(",", ""))
+            date_str = " ".join(fields[name] for name in self.date_fields)
+            if not self.has_year:
+                date_str = f"{date_str} {year}"
+            txn_date = datetime.strptime(date_str, self.date_format).date()
+        except ValueError:
+            return None
+        if amount < 0:
+            return None
+        return (txn_date.month, txn_date.year), (txn_date, fields["desc"], fields["category"], amount, self.source)
+
+
+# html statements by source. a bank without an entry here is read from its csv or OFX download
+ADAPTERS = {adapter.source: adapter for adapter in [
+    BankAdapter(
+        TransactionSource.C1,
+        container="div.c1-ease-table__body",
+        row="*",
+        row_depth=1,
+        fields={
+            "month": "span.c1-ease-txns-date-and-status__month",
+            "day": "span.c1-ease-txns-date-and-status__day",
+            "desc": "div.c1-ease-txns-description__description",
+            "category": "span.c1-ease-card-transactions-view-table__rewards-category",
+            "amount": "c1-ease-cell.c1-ease-card-transactions-view-table__amount",
+        },
+        # pending rows show no post date, so they are dropped for missing the month
+        date_fields=("month", "day"),
+        date_format="%b %d",
+    ),
+    BankAdapter(
+        TransactionSource.DISC,
+        container="table#transactions-table",
+        row=r"tr#transaction-\d+",
+        fields={
+            "date": "td.trans-date",
+            "desc": "a.transaction-detail-toggler",
+            "category": "td.ctg",
+            "amount": "td.amt",
+        },
+        date_format="%m/%d/%y",
+    ),
+]}
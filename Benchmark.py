@@ -0,0 +1,175 @@
+import argparse, json, os, platform, shutil, subprocess, tempfile, time, tracemalloc
+from datetime import date, datetime
+from os.path import abspath, dirname, join
+from StatementGenerator import StatementGenerator
+from Importer import Importer
+from Categorizer import Categorizer
+from TransactionBatch import TransactionBatch
+from BankAdapter import ADAPTERS
+from Reporter import Reporter
+from classes import TransactionSource, Month
+
+REPO = dirname(abspath(__file__))
+# literal and regex rules each in the categorize_many_rules stage
+RULE_COUNT = 1000
+
+
+# times each Importer/Reporter stage against generated statements and records peak memory
+class Benchmark:
+    def __init__(self, year=2023, seed=0, trace_memory=True):
+        self.year = year
+        self.seed = seed
+        self.trace_memory = trace_memory
+
+    # run fn, returning its result and {"seconds", "peak_bytes"}
+    def measure(self, fn, *args):
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = time.perf_counter() - start
+        peak = None
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        return result, {"seconds": round(seconds, 6), "peak_bytes": peak}
+
+    def merge_batches(self, batches):
+        batch = TransactionBatch()
+        for statement in batches:
+            batch.extend(statement)
+        return batch
+
+    def categorize(self, categorizer, batches):
+        for batch in batches:
+            categorizer.apply(batch)
+
+    # count rows, each with its own description, about a third matching a generated literal rule and a third a regex rule
+    def distinct_batch(self, count):
+        batch = TransactionBatch()
+        for i in range(count):
+            merchant = ["MERCHANT", "SHOP", "STORE"][i % 3]
+            batch.append(date(self.year, 1, 1), f"POS {merchant} {i % RULE_COUNT:04d}  #{i}", "Other", 10.0, TransactionSource.C1)
+        return batch
+
+    # settings.json's rules followed by count generated literal rules and count regex rules
+    def write_rules(self, filepath, count):
+        with open("settings.json", "r") as file:
+            rules = json.load(file).get("Rules", [])
+        rules += [{"category": f"Merchant {i}", "contains": f"MERCHANT {i:04d}"} for i in range(count)]
+        rules += [{"category": f"Shop {i}", "regex": rf"SHOP {i:04d}\s+#\d+"} for i in range(count)]
+        with open(filepath, "w") as out_file:
+            json.dump({"Rules": rules}, out_file)
+
+    # all stages for one statement size, run inside a scratch directory laid out like the repo
+    def run_size(self, count):
+        stages = {}
+        workdir = tempfile.mkdtemp(prefix="budget-bench-")
+        cwd = os.getcwd()
+        try:
+            os.chdir(workdir)
+            for folder in ["actual", "goals", "reports", "statements"]:
+                os.makedirs(folder)
+            shutil.copy(join(REPO, "settings.json"), "settings.json")
+
+            generator = StatementGenerator(self.seed)
+            generator.write_c1("statements/c1.html", count, self.year)
+            generator.write_disc("statements/disc.html", count, self.year)
+            generator.write_sofi("statements/sofi.csv", count, self.year)
+            generator.write_bofa("statements/bofa.ofx", count, self.year)
+
+            importer = Importer()
+            streaming_importer = Importer(stream=True)
+            c1_adapter, disc_adapter = ADAPTERS[TransactionSource.C1], ADAPTERS[TransactionSource.DISC]
+            c1, stages["parse_c1"] = self.measure(importer.import_statement, "statements/c1.html", c1_adapter, self.year)
+            _, stages["parse_c1_stream"] = self.measure(streaming_importer.import_statement, "statements/c1.html", c1_adapter, self.year)
+            disc, stages["parse_disc"] = self.measure(importer.import_statement, "statements/disc.html", disc_adapter, self.year)
+            _, stages["parse_disc_stream"] = self.measure(streaming_importer.import_statement, "statements/disc.html", disc_adapter, self.year)
+            _, stages["parse_sofi_csv"] = self.measure(importer.import_download, "statements/sofi.csv", TransactionSource.SOFI)
+            _, stages["parse_bofa_ofx"] = self.measure(importer.import_download, "statements/bofa.ofx", TransactionSource.BOFA)
+
+            transactions = importer.merge_transactions([c1, disc])
+            # each month's statements are categorized as one batch, as export_month does
+            month_batches = [self.merge_batches(batches) for batches in transactions.values()]
+            _, stages["categorize"] = self.measure(self.categorize, Categorizer(), month_batches)
+            # thousands of literal and regex rules against as many rows, every description new
+            self.write_rules("rules.json", RULE_COUNT)
+            _, stages["categorize_many_rules"] = self.measure(self.categorize, Categorizer("rules.json", "actual/.rules-categories.json"), [self.distinct_batch(count)])
+            _, stages["export_transactions"] = self.measure(importer.export_transactions, transactions, 5000, None, None)
+
+            # report on the busiest month
+            month_value, year = max(transactions, key=lambda key: sum(len(batch) for batch in transactions[key]))
+            month = Month.from_value(month_value)
+            reporter = Reporter(force=True)
+            actual, stages["load_actual"] = self.measure(reporter.load_actual, month, year)
+            model, stages["build_model"] = self.measure(reporter.build_model, month, year, actual)
+
+            _, stages["create_spend_piechart"] = self.measure(reporter.create_spend_piechart, model.actual_spend, "Actual Spend")
+            _, stages["create_cumulative_linechart"] = self.measure(reporter.create_cumulative_linechart, model, "Cumulative Spend")
+            _, stages["create_per_category_barchart"] = self.measure(reporter.create_per_category_barchart, model)
+            _, stages["create_totals_barchart"] = self.measure(reporter.create_totals_barchart, model)
+            _, stages["create_report"] = self.measure(reporter.create_report, month, year)
+        finally:
+            os.chdir(cwd)
+            shutil.rmtree(workdir, ignore_errors=True)
+        return stages
+
+    def run(self, sizes):
+        return {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "trace_memory": self.trace_memory,
+            "results": {str(count): self.run_size(count) for count in sizes},
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO, capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+# print per-stage time ratios between two saved result files
+def compare(baseline_path, candidate_path):
+    with open(baseline_path, "r") as file:
+        baseline = json.load(file)
+    with open(candidate_path, "r") as file:
+        candidate = json.load(file)
+
+    print(f"{'size':>8} {'stage':<30} {'baseline s':>12} {'candidate s':>12} {'ratio':>8}")
+    for size, stages in candidate["results"].items():
+        for stage, result in stages.items():
+            before = baseline["results"].get(size, {}).get(stage)
+            if not before:
+                continue
+            ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("nan")
+            print(f"{size:>8} {stage:<30} {before['seconds']:>12.4f} {result['seconds']:>12.4f} {ratio:>8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the import and report pipeline")
+    parser.add_argument('-n', '--sizes', type=int, nargs='+', default=[100, 1000, 10000], help='Transactions per generated statement')
+    parser.add_argument('-o', '--output', help='Where to save the json results (defaults to benchmarks/<revision>.json)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for generated statements')
+    parser.add_argument('--no-memory', action='store_true', help='Skip tracemalloc, which slows the timed stages down')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CANDIDATE'), help='Compare two saved result files instead of running')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        exit(0)
+
+    results = Benchmark(seed=args.seed, trace_memory=not args.no_memory).run(args.sizes)
+    output = args.output or join(REPO, "benchmarks", f"{results['revision'] or 'results'}.json")
+    os.makedirs(dirname(abspath(output)), exist_ok=True)
+    with open(output, "w") as out_file:
+        json.dump(results, out_file, indent=2)
+
+    for size, stages in results["results"].items():
+        for stage, result in stages.items():
+            peak = f"{result['peak_bytes'] / 2**20:.1f} MiB" if result["peak_bytes"] is not None else "-"
+            print(f"{size:>8} {stage:<30} {result['seconds']:>10.4f}s {peak:>12}")
+    print(f"Saved results to {output}")
@@ -0,0 +1,55 @@
+import json, os
+from hashlib import blake2b
+from os.path import exists
+from FileLock import write_atomic
+
+
+# content hashes of the inputs each report was last built from, so unchanged reports can be skipped
+class BuildManifest:
+    def __init__(self, filepath="reports/.manifest.json"):
+        self.filepath = filepath
+        self.entries = {}
+        self.dirty = False
+
+        if exists(filepath):
+            with open(filepath, "r") as in_file:
+                self.entries = json.load(in_file)
+
+    # hash raw bytes or a json-serializable value
+    @staticmethod
+    def hash_value(value):
+        if not isinstance(value, bytes):
+            value = json.dumps(value, sort_keys=True, default=str).encode()
+        return blake2b(value, digest_size=16).hexdigest()
+
+    @staticmethod
+    def hash_file(filepath):
+        if not exists(filepath):
+            return None
+        h = blake2b(digest_size=16)
+        with open(filepath, "rb") as in_file:
+            while chunk := in_file.read(1 << 20):
+                h.update(chunk)
+        return h.hexdigest()
+
+    # "mtime:size" of a file, which moves whenever it is rewritten. cheap enough to check before hashing
+    @staticmethod
+    def stat_file(filepath):
+        stat = os.stat(filepath)
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    # true if the report exists and was built from exactly these inputs
+    def is_fresh(self, key, output, inputs):
+        return exists(output) and self.entries.get(key) == inputs
+
+    def record(self, key, inputs):
+        if self.entries.get(key) != inputs:
+            self.entries[key] = inputs
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        write_atomic(self.filepath, lambda out_file: json.dump(self.entries, out_file, indent=2, sort_keys=True))
+        self.dirty = False
@@ -0,0 +1,233 @@
+import json, re
+from hashlib import blake2b
+from os.path import exists
+from classes import TransactionSource
+from FileLock import write_atomic
+from TransactionBatch import SOURCES
+
+# bumped whenever what is memoized per description changes, so older caches are not read back
+CACHE_VERSION = 2
+
+
+# characters that end the literal start of a regex
+REGEX_META = set(".^$*+?{}[]|()")
+
+
+# merchant rules from settings.json, matched against a batch's distinct descriptions only.
+# literal substrings, and the literal each regex must start with, share a single trie-shaped regex run once
+# over all the descriptions at every position, so every rule a description matches is found. a regex is
+# only tried on descriptions holding its literal; the few with none sit behind one combined alternation.
+# a row takes the earliest rule in settings order that fits its bank and amount.
+# the rules a description matches are memoized across runs in actual/.categories.json
+class Categorizer:
+    def __init__(self, settings="settings.json", cache_filepath="actual/.categories.json"):
+        self.cache_filepath = cache_filepath
+        # (category, source or None, min amount or None, max amount or None), in settings order
+        self.rules = []
+        # lowercased substring -> rule indices
+        self.literals = {}
+        # (compiled regex, rule index), and the regexes to try for each lowercased literal they start with
+        self.regexes = []
+        self.keyed_regexes = {}
+        # regexes without a literal start, and one alternation of them all that a description must match first
+        self.unkeyed_regexes = []
+        self.unkeyed_pattern = None
+        # trie of every literal, and for each the (rule indices, regexes) it and the literals it starts with bring in
+        self.literal_pattern = None
+        self.literal_matches = {}
+        self.matches = {}
+        self.dirty = False
+
+        rules = []
+        if exists(settings):
+            with open(settings, "r") as file:
+                rules = json.load(file).get("Rules", [])
+        self.compile(rules)
+
+        self.rules_hash = blake2b(json.dumps([CACHE_VERSION, rules], sort_keys=True).encode(), digest_size=16).hexdigest()
+        if self.rules and exists(cache_filepath):
+            with open(cache_filepath, "r") as in_file:
+                cache = json.load(in_file)
+            # matches are only valid for the exact rules they were computed against
+            if cache.get("rules") == self.rules_hash:
+                self.matches = cache.get("matches", {})
+
+    def __len__(self):
+        return len(self.rules)
+
+    # each rule is {"category", "contains" and/or "regex" (a string or list), optional "bank", "min", "max"}.
+    # rules are tried in settings order, so a per-bank override goes above the generic rule it overrides
+    def compile(self, rules):
+        for rule in rules:
+            source = TransactionSource.from_value(rule["bank"]) if rule.get("bank") else None
+            index = len(self.rules)
+            self.rules.append((rule["category"], source, rule.get("min"), rule.get("max")))
+
+            for literal in filter(None, as_list(rule.get("contains"))):
+                self.literals.setdefault(literal.lower(), []).append(index)
+            for regex in as_list(rule.get("regex")):
+                literal = regex_literal(regex)
+                if literal:
+                    self.keyed_regexes.setdefault(literal, []).append(len(self.regexes))
+                else:
+                    self.unkeyed_regexes.append(len(self.regexes))
+                self.regexes.append((re.compile(regex, re.IGNORECASE), index))
+
+        keys = self.literals.keys() | self.keyed_regexes.keys()
+        for key in keys:
+            prefixes = [key[:end] for end in range(len(key), 0, -1) if key[:end] in keys]
+            self.literal_matches[key] = (
+                [i for prefix in prefixes for i in self.literals.get(prefix, ())],
+                [i for prefix in prefixes for i in self.keyed_regexes.get(prefix, ())],
+            )
+        # a zero-width lookahead so the trie is tried at every position, including inside an earlier match.
+        # it runs over lowercased text, which is much faster than matching without case
+        if keys:
+            self.literal_pattern = re.compile(f"(?=({trie_pattern(keys)}))")
+        if self.unkeyed_regexes:
+            try:
+                self.unkeyed_pattern = re.compile("|".join(f"(?:{self.regexes[i][0].pattern})" for i in self.unkeyed_regexes), re.IGNORECASE)
+            except re.error:
+                # inline flags only work at the start of a pattern, so such rules are each tried on their own
+                pass
+
+    # memoize the indices of every rule matching each (distinct) description not seen before, in settings order.
+    # the trie runs once over all of them joined together, and names the literal rules matched and the regexes
+    # worth trying on each description
+    def scan(self, descs):
+        new = [desc for desc in descs if desc not in self.matches]
+        if not new:
+            return
+
+        found = [set() for _ in new]
+        candidates = [set() for _ in new]
+        if self.literal_pattern:
+            # no literal holds the separator, so no match spans two descriptions. matches come in order,
+            # so the description each is in only ever moves forward
+            lowered = [desc.lower() for desc in new]
+            i, end = 0, len(lowered[0])
+            for match in self.literal_pattern.finditer("\0".join(lowered)):
+                while match.start() > end:
+                    i += 1
+                    end += len(lowered[i]) + 1
+                indices, regexes = self.literal_matches[match.group(1)]
+                found[i].update(indices)
+                candidates[i].update(regexes)
+        if self.unkeyed_regexes:
+            for i, desc in enumerate(new):
+                if self.unkeyed_pattern is None or self.unkeyed_pattern.search(desc):
+                    candidates[i].update(self.unkeyed_regexes)
+
+        for desc, indices, regexes in zip(new, found, candidates):
+            for regex in regexes:
+                pattern, index = self.regexes[regex]
+                if index not in indices and pattern.search(desc):
+                    indices.add(index)
+            self.matches[desc] = sorted(indices)
+        self.dirty = True
+
+    # recategorize a TransactionBatch in place, returning how many rows changed.
+    # rules are matched against each distinct description once, then resolved per distinct (description, bank)
+    # and applied to the whole column: the i-th pass takes each row's i-th rule for its bank wherever its
+    # amount fits and no earlier rule did
+    def apply(self, batch):
+        if not self.rules or not len(batch):
+            return 0
+        import numpy as np
+
+        descs = list(dict.fromkeys(batch.descs))
+        self.scan(descs)
+        desc_codes = {desc: code for code, desc in enumerate(descs)}
+        keys = np.fromiter(map(desc_codes.__getitem__, batch.descs), dtype=np.int64, count=len(batch))
+        # the bank only splits descriptions when some rule is bank-specific. source codes are shifted up
+        # by one so rows without a source (-1) key as 0
+        width = len(SOURCES) + 1 if any(source is not None for _, source, _, _ in self.rules) else 1
+        if width > 1:
+            keys = keys * width + np.frombuffer(batch.source_codes, dtype=np.int8) + 1
+        pairs, inverse = np.unique(keys, return_inverse=True)
+
+        candidates = []
+        for key in pairs.tolist():
+            matches = self.matches[descs[key // width]]
+            if width > 1 and matches:
+                source = SOURCES[key % width - 1] if key % width else None
+                matches = [i for i in matches if self.rules[i][1] in (None, source)]
+            candidates.append(matches)
+        depth = max(map(len, candidates))
+        if not depth:
+            return 0
+
+        lows = np.array([-np.inf if low is None else low for _, _, low, _ in self.rules])
+        highs = np.array([np.inf if high is None else high for _, _, _, high in self.rules])
+        amounts = np.frombuffer(batch.cents, dtype=np.int64) / 100
+        chosen = np.full(len(batch), -1)
+        for tier in range(depth):
+            rule = np.array([indices[tier] if tier < len(indices) else -1 for indices in candidates])[inverse]
+            fits = (rule >= 0) & (chosen < 0) & (amounts >= lows[rule]) & (amounts <= highs[rule])
+            chosen[fits] = rule[fits]
+
+        hit = chosen >= 0
+        rule_codes = np.full(len(self.rules), -1, dtype=np.int32)
+        for index in np.unique(chosen[hit]).tolist():
+            rule_codes[index] = batch.category_code(self.rules[index][0])
+        codes = np.frombuffer(batch.category_codes, dtype=np.int32)
+        changed = hit & (codes != rule_codes[chosen])
+        codes[changed] = rule_codes[chosen[changed]]
+        return int(changed.sum())
+
+    def save(self):
+        if not self.dirty:
+            return
+
+        write_atomic(self.cache_filepath, lambda out_file: json.dump({"rules": self.rules_hash, "matches": self.matches}, out_file, separators=(",", ":")))
+        self.dirty = False
+
+
+def as_list(value):
+    if value is None:
+        return []
+    return [value] if isinstance(value, str) else list(value)
+
+
+# the lowercased literal text every match of a regex starts with, or "" when it has none (or it is unclear).
+# a character is left out if a quantifier that allows zero of it follows
+def regex_literal(regex):
+    if "|" in regex:
+        return ""
+    chars = []
+    i = 1 if regex.startswith("^") else 0
+    while i < len(regex):
+        char, step = regex[i], 1
+        if char == "\\":
+            if i + 1 == len(regex) or regex[i + 1].isalnum():
+                break
+            char, step = regex[i + 1], 2
+        elif char in REGEX_META:
+            break
+        if regex[i + step:i + step + 1] in ("?", "*", "{"):
+            break
+        chars.append(char)
+        i += step
+    return "".join(chars).lower()
+
+
+# regex matching any of the given lowercase strings, shaped as a trie so matching
+# only ever follows one branch per character and prefers the longest string
+def trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def render(node):
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if "" in node:
+            return f"(?:{body})?"
+        return body
+
+    return render(trie)
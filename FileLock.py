@@ -0,0 +1,58 @@
+import os
+from os.path import basename, dirname, join
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+# lock file that sits next to the file it guards, hidden so globs over the directory skip it
+def lock_path(filepath):
+    return join(dirname(filepath), f".{basename(filepath)}.lock")
+
+
+# exclusive advisory lock held across processes for the duration of a with block.
+# the kernel drops it if the holder dies, so a crashed importer never leaves a file locked
+class FileLock:
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.fd = None
+
+    def __enter__(self):
+        os.makedirs(dirname(self.filepath) or ".", exist_ok=True)
+        self.fd = os.open(self.filepath, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self.fd, msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+        else:
+            msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
+        os.close(self.fd)
+        self.fd = None
+        return False
+
+
+# replace filepath with content written by write(out_file), so readers never see a partial file.
+# before_replace(tmp_filepath) runs once the new content is on disk, just ahead of the rename
+def write_atomic(filepath, write, mode="w", newline=None, before_replace=None):
+    os.makedirs(dirname(filepath) or ".", exist_ok=True)
+    tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_filepath, mode, newline=newline) as out_file:
+            write(out_file)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        if before_replace:
+            before_replace(tmp_filepath)
+        os.replace(tmp_filepath, filepath)
+    except BaseException:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+        raise
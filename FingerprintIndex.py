@@ -0,0 +1,109 @@
+import os
+from collections import defaultdict
+from hashlib import blake2b
+from os.path import exists
+from BuildManifest import BuildManifest
+from FileLock import write_atomic
+
+
+# index for one month's csv, kept next to it so each month is deduped under that month's lock alone
+def month_index_path(month, year, csv_dir="actual"):
+    return f"{csv_dir}/.{month}_{year}.fingerprints"
+
+
+# persistent set of fingerprints for every row already written to a month,
+# so re-importing an overlapping statement can skip rows in O(1) without re-reading the month csvs
+class FingerprintIndex:
+    # without a filepath the index lives only in memory, for sinks that store fingerprints themselves
+    def __init__(self, filepath=None):
+        self.filepath = filepath
+        self.journal_path = f"{filepath}.pending" if filepath else None
+        self.fingerprints = set()
+        self.pending = []
+        # bytes of the file already read, so fingerprints other processes append can be picked up later
+        self.offset = 0
+        self.refresh()
+
+    # read fingerprints appended to the file since it was last read
+    def refresh(self):
+        if not self.filepath or not exists(self.filepath):
+            return
+        with open(self.filepath, "rb") as in_file:
+            in_file.seek(self.offset)
+            data = in_file.read()
+        # a line still being written by an older, unlocked writer is left for the next read
+        end = data.rfind(b"\n") + 1
+        self.fingerprints.update(line.strip() for line in data[:end].decode().splitlines() if line.strip())
+        self.offset += end
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self.fingerprints
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    # hash the identifying fields of a row into a short, stable key
+    def fingerprint(self, *fields):
+        key = "\x1f".join(str(field) for field in fields)
+        return blake2b(key.encode(), digest_size=8).hexdigest()
+
+    # fingerprint a transaction from its exported date, description, amount and source abbreviation;
+    # occurrence tells apart identical rows within one statement
+    def transaction_fingerprint(self, date, desc, amt, source, occurrence=0):
+        return self.fingerprint("txn", date, desc, amt, source or "", occurrence)
+
+    # fingerprints of rows already written as (date, description, category, amount[, source]), counting identical
+    # rows apart as an import does within a statement. rows with no source, such as those in csvs written before
+    # it was recorded, get the fingerprint an import checks when matching on date, description and amount alone
+    def row_fingerprints(self, rows):
+        occurrences = defaultdict(int)
+        fingerprints = []
+        for date, desc, _, amt, *source in rows:
+            if date in (None, ""):
+                continue
+            # older imports wrote zero-padded days, such as "05 3 2023"
+            date = " ".join(part.lstrip("0") or "0" for part in str(date).split())
+            fields = (date, desc, float(amt), source[0] if source else None)
+            fingerprints.append(self.transaction_fingerprint(*fields, occurrences[fields]))
+            occurrences[fields] += 1
+        return fingerprints
+
+    # record a fingerprint, returning False if it was already present
+    def add(self, fingerprint):
+        if fingerprint in self.fingerprints:
+            return False
+        self.fingerprints.add(fingerprint)
+        self.pending.append(fingerprint)
+        return True
+
+
+    # ------------ COMMIT ------------
+    # a month's csv and its fingerprints are committed together: journal() records the unsaved fingerprints
+    # with the hash of the csv about to be renamed into place, the rename is the commit point, and save()
+    # then retires the journal. a process that dies in between leaves the journal for recover()
+    def journal(self, file_hash):
+        write_atomic(self.journal_path, lambda out_file: out_file.write("\n".join([file_hash] + self.pending) + "\n"))
+
+    # apply a journal left by an importer that died mid-commit if its csv made it into place, otherwise drop it
+    def recover(self, filepath):
+        if not exists(self.journal_path):
+            return
+        with open(self.journal_path, "r") as in_file:
+            file_hash, *fingerprints = in_file.read().split()
+        if BuildManifest.hash_file(filepath) == file_hash:
+            for fingerprint in fingerprints:
+                self.add(fingerprint)
+        self.save()
+
+    # append newly seen fingerprints to disk
+    def save(self):
+        if self.pending:
+            os.makedirs(os.path.dirname(self.filepath) or ".", exist_ok=True)
+            with open(self.filepath, "a") as out_file:
+                out_file.write("\n".join(self.pending) + "\n")
+                out_file.flush()
+                os.fsync(out_file.fileno())
+                self.offset = out_file.tell()
+            self.pending = []
+        if self.journal_path and exists(self.journal_path):
+            os.remove(self.journal_path)
@@ -0,0 +1,96 @@
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+
+QUANTILES = [10, 50, 90]
+
+
+# monte carlo projection of spend per category. each simulated day is a whole historical day
+# (every category at once, so categories that move together stay together), drawn from days
+# that fell on the same weekday. all paths and days are drawn in one go with numpy
+class Forecaster:
+    def __init__(self, paths=2000, history_days=365, min_history_days=28, seed=0):
+        self.paths = paths
+        self.history_days = history_days
+        self.min_history_days = min_history_days
+        self.seed = seed
+
+    # (dates, categories, days x categories matrix) of spend per calendar day up to and including as_of,
+    # with zero rows for days nothing was spent. history has Year, Month, Day, Category and Amount columns
+    def daily_matrix(self, history, as_of):
+        history = history[history["Day"] > 0]
+        if history.empty:
+            return None
+        dates = pd.to_datetime(pd.DataFrame({"year": history["Year"], "month": history["Month"], "day": history["Day"]}))
+        start = max(dates.min(), pd.Timestamp(as_of - timedelta(days=self.history_days - 1)))
+        days = pd.date_range(start, pd.Timestamp(as_of), freq="D")
+        if len(days) < self.min_history_days:
+            return None
+
+        daily = history.assign(Date=dates.values).pivot_table(index="Date", columns="Category", values="Amount", aggfunc="sum")
+        daily = daily.reindex(days, fill_value=0).fillna(0)
+        return days, list(daily.columns), daily.to_numpy(dtype=float)
+
+    # (paths x days x categories) spend for the given future dates
+    def draw(self, rng, days, matrix, future):
+        weekdays = np.asarray(days.weekday)
+        order = np.argsort(weekdays, kind="stable")
+        counts = np.bincount(weekdays, minlength=7)
+        starts = np.cumsum(counts) - counts
+
+        future_weekdays = np.array([d.weekday() for d in future])
+        offsets = (rng.random((self.paths, len(future))) * counts[future_weekdays]).astype(int)
+        return matrix[order[starts[future_weekdays] + offsets]]
+
+    # projected month-end and year-end spend per category as of a date, and the chance of overrunning each target.
+    # month_actual/year_actual are spend so far per category; month_target/year_target are budgets per category
+    def forecast(self, history, as_of, month_actual, year_actual, month_target, year_target):
+        daily = self.daily_matrix(history, as_of)
+        if daily is None:
+            return None
+        days, spent_categories, matrix = daily
+        categories = sorted(set(spent_categories) | set(month_target.index) | set(year_target.index))
+        matrix = pd.DataFrame(matrix, columns=spent_categories).reindex(columns=categories, fill_value=0).to_numpy()
+
+        rng = np.random.default_rng(self.seed)
+        month_end = (as_of.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+        year_end = as_of.replace(month=12, day=31)
+        month_days = [as_of + timedelta(days=i) for i in range(1, (month_end - as_of).days + 1)]
+
+        # the rest of the month, day by day, so the cumulative band can be drawn
+        draws = self.draw(rng, days, matrix, month_days) if month_days else np.zeros((self.paths, 0, len(categories)))
+        month_base = month_actual.reindex(categories, fill_value=0).to_numpy()
+        month_totals = month_base + draws.sum(axis=1)
+        cumulative = month_base.sum() + draws.sum(axis=2).cumsum(axis=1)
+
+        # the rest of the year after this month, a month-sized block at a time to bound memory
+        year_totals = year_actual.reindex(categories, fill_value=0).to_numpy() + draws.sum(axis=1)
+        day = month_end
+        while day < year_end:
+            block = [day + timedelta(days=i) for i in range(1, min(31, (year_end - day).days) + 1)]
+            year_totals = year_totals + self.draw(rng, days, matrix, block).sum(axis=1)
+            day = block[-1]
+
+        month_target = month_target.reindex(categories)
+        year_target = year_target.reindex(categories)
+        month_low, month_mid, month_high = np.percentile(month_totals, QUANTILES, axis=0)
+        year_low, year_mid, year_high = np.percentile(year_totals, QUANTILES, axis=0)
+        band = np.percentile(cumulative, QUANTILES, axis=0) if month_days else np.zeros((3, 0))
+        total_low, total_mid, total_high = np.percentile(month_totals.sum(axis=1), QUANTILES)
+        year_total_low, year_total_mid, year_total_high = np.percentile(year_totals.sum(axis=1), QUANTILES)
+
+        return {
+            "as_of": as_of,
+            "dates": month_days,
+            "band": band,
+            "month": pd.DataFrame({
+                "Category": categories, "Actual": month_base, "Low": month_low, "Median": month_mid, "High": month_high,
+                "Target": month_target.values, "Overrun": (month_totals > month_target.fillna(np.inf).to_numpy()).mean(axis=0),
+            }),
+            "year": pd.DataFrame({
+                "Category": categories, "Low": year_low, "Median": year_mid, "High": year_high,
+                "Target": year_target.values, "Overrun": (year_totals > year_target.fillna(np.inf).to_numpy()).mean(axis=0),
+            }),
+            "month_total": (total_low, total_mid, total_high),
+            "year_total": (year_total_low, year_total_mid, year_total_high),
+        }
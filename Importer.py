@@ -1,38 +1,148 @@
 import csv, re, calendar
 from datetime import datetime
 from os.path import exists
-from classes import Transaction, TransactionSource, Month
-from bs4 import BeautifulSoup
+from classes import TransactionSource, Month
 from collections import defaultdict 
+from RowStreamer import RowStreamer
+from OfxStreamer import OfxStreamer
+from FingerprintIndex import FingerprintIndex, month_index_path
+from FileLock import FileLock, lock_path, write_atomic
+from TransactionBatch import TransactionBatch
+from Categorizer import Categorizer
+from BuildManifest import BuildManifest
+from BankAdapter import ADAPTERS
+from RollupCache import csv_source
+
+# header names each field goes by across banks' csv downloads
+CSV_COLUMNS = {
+    "date": ["date", "posted date", "transaction date"],
+    "desc": ["description", "payee", "name"],
+    "amount": ["amount"],
+    "category": ["category"],
+}
+CSV_DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y"]
+# path words and content markers that give away which bank a statement came from
+SOURCE_NAMES = {
+    "c1": TransactionSource.C1, "capitalone": TransactionSource.C1,
+    "disc": TransactionSource.DISC, "discover": TransactionSource.DISC,
+    "sofi": TransactionSource.SOFI,
+    "bofa": TransactionSource.BOFA, "boa": TransactionSource.BOFA, "bankofamerica": TransactionSource.BOFA,
+}
+SOURCE_MARKERS = [
+    ("c1-ease", TransactionSource.C1),
+    ("transactions-table", TransactionSource.DISC),
+    ("bank of america", TransactionSource.BOFA),
+    ("running bal.", TransactionSource.BOFA),
+    ("sofi", TransactionSource.SOFI),
+    ("current balance,status", TransactionSource.SOFI),
+]
+# csv and OFX downloads carry no spend category; rules and mappings take it from here
+DEFAULT_CATEGORY = "Other"
+# the single index every month shared before each month got its own; still honoured so old imports stay deduped
+LEGACY_INDEX = "actual/.fingerprints"
+# downloads any bank can export, read by format rather than through the bank's html adapter
+DOWNLOAD_SUFFIXES = (".ofx", ".qfx", ".csv")
+
+# bs4 is only loaded once a statement is actually parsed
+def parse_html(markup):
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(markup, "html.parser")
+
 
 class Importer:
-    def __init__(self):
-        pass        
+    def __init__(self, stream=False, dedupe=True, ledger=None, rollups=None):
+        # when set, statements are walked row by row instead of parsed into one tree
+        self.stream = stream
+        # when set, rows already recorded in the fingerprint index are skipped
+        self.dedupe = dedupe
+        # optional LedgerStore to write to instead of the per-month csvs
+        self.ledger = ledger
+        # optional RollupCache kept in step with every write
+        self.rollups = rollups
+        # settings.json merchant rules, compiled on first use
+        self.categorizer = None
     
     def run(self, source, filepath, year, salary, capital_gains, other_income):
-        transactions = self.extract(source, filepath, year)
-        self.export_transactions(transactions, salary, capital_gains, other_income)
-        return list(map(lambda t: (Month.from_value(t[0]), t[1]), transactions.keys()))
+        return self.run_many([(source, filepath)], year, salary, capital_gains, other_income)
+    
+    # import several (source, filepath) statements at once and write each touched month a single time
+    def run_many(self, jobs, year, salary, capital_gains, other_income, workers=None):
+        # parsing runs fully in parallel with other importers; each month is then deduped and written
+        # under that month's lock alone, so importers only wait on each other for months they share
+        results = self.extract_many(jobs, year, workers)
+        transactions = self.merge_transactions(results)
+        imported = self.export_transactions(transactions, salary, capital_gains, other_income)
+        return [(Month.from_value(month), year) for month, year in imported]
+    
+    # parse statements across a process pool, returning one bucket dict per statement
+    def extract_many(self, jobs, year, workers=None):
+        if len(jobs) <= 1 or workers == 1:
+            return [self.extract(source, filepath, year) for source, filepath in jobs]
+        
+        from concurrent.futures import ProcessPoolExecutor
+        sources, filepaths = zip(*jobs)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(extract_statement, [self.stream] * len(jobs), sources, filepaths, [year] * len(jobs)))
+    
+    # group per-statement (month, year) buckets by month in a single pass. each statement's batch is kept
+    # apart until it is deduped, since repeats are counted within a statement
+    def merge_transactions(self, results):
+        transactions = defaultdict(list)
+        for result in results:
+            if not result:
+                continue
+            for key, batch in result.items():
+                transactions[key].append(batch)
+        return transactions
+    
+    # indices of a statement's rows not yet in the index (or the legacy one), recording the new ones as pending.
+    # rows written without their bank (csvs from before the index, ledgers migrated from them) are indexed
+    # without a source, so each row is also looked up by its date, description and amount alone
+    def dedupe_batch(self, batch, index, legacy=None):
+        kept = []
+        # identical rows within one statement are real repeats, so count them apart
+        occurrences = defaultdict(int)
+        for i, (date_str, desc, _, amt, source) in enumerate(batch.rows()):
+            fields = (date_str, desc, amt, source)
+            fingerprint = index.transaction_fingerprint(date_str, desc, amt, source, occurrences[fields])
+            unsourced = index.transaction_fingerprint(date_str, desc, amt, None, occurrences[fields[:3]])
+            occurrences[fields] += 1
+            occurrences[fields[:3]] += 1
+            if (legacy is not None and fingerprint in legacy) or unsourced in index:
+                continue
+            if index.add(fingerprint):
+                kept.append(i)
+        return kept
+        
+    
+    # guess a statement's bank from its folder or file name, falling back to the start of its contents
+    def detect_source(self, filepath):
+        for word in re.split(r"[^a-z0-9]+", filepath.lower()):
+            if word in SOURCE_NAMES:
+                return SOURCE_NAMES[word]
         
+        with open(filepath, "r", errors="replace") as in_file:
+            head = in_file.read(64 * 1024).lower()
+        for marker, source in SOURCE_MARKERS:
+            if marker in head:
+                return source
+        return None
+    
     
     # extract transactions based on bank
     def extract(self, source, filepath, year):            
         if not year:
             year = datetime.now().date().year
             
-        transactions = None
-        match source:
-            case TransactionSource.C1:
-                transactions = self.import_c1(filepath, year)
-            case TransactionSource.DISC:
-                transactions = self.import_disc(filepath)
-            case TransactionSource.SOFI:
-                transactions = self.import_sofi(filepath)
-            case TransactionSource.BOFA:
-                transactions = self.import_bofa(filepath)
-            case _:
-                print(f"Could not find transaction source for {source}")
-                return
+        if not source:
+            print(f"Could not find transaction source for {source}")
+            return
+        
+        adapter = ADAPTERS.get(source)
+        if adapter and not filepath.lower().endswith(DOWNLOAD_SUFFIXES):
+            transactions = self.import_statement(filepath, adapter, year)
+        else:
+            transactions = self.import_download(filepath, source)
         
         if not transactions:
             print(f"Warning: could not find any transactions in {filepath}")
@@ -40,99 +150,225 @@ class Importer:
         return transactions
             
     
-    # find value of item with given classname
-    def find_item_c1(self, html, tag, classname):
-        try:
-            if tag == "c1-ease-cell":
-                amt_html = html.find(tag, {"class": classname})
-                for span in amt_html:
-                    return span.text.strip().replace("$", "").replace(",", "")
-                
-            return html.find(tag, {"class": classname}).text.strip()
-        except:
-            return None 
-    
-    
-    # import Capital One transactions
-    def import_c1(self, filepath, year):
-        transactions = defaultdict(list)
-        with open(filepath, "r") as in_file:
-            soup = BeautifulSoup(in_file.read(), "html.parser")
-            tables = soup.find_all("div", {"class": "c1-ease-table__body"})
-            for table in tables:
-                for row in table:
-                    if not row or not row.text.split():
-                        continue
-                    
-                    amt = self.find_item_c1(row, "c1-ease-cell", "c1-ease-card-transactions-view-table__amount")
-                    if not amt or float(amt) < 0:
-                        continue
-                    
-                    month_abbr = self.find_item_c1(row, "span", "c1-ease-txns-date-and-status__month")
-                    if month_abbr == None:
-                        # if transaction is still pending, no post date shown
-                        continue
-                    
-                    month = datetime.strptime(month_abbr, "%b").month
-                    day = self.find_item_c1(row, "span", "c1-ease-txns-date-and-status__day")
-                    desc = self.find_item_c1(row, "div", "c1-ease-txns-description__description")
-                    category = self.find_item_c1(row, "span", "c1-ease-card-transactions-view-table__rewards-category")
-                    if category and month and day and desc and amt:
-                        transactions[(month, year)].append(Transaction(f"{day} {month} {year}", desc, category, float(amt)))
-        
+    # group (key, (date, desc, category, amount, source)) pairs into (month, year) batches
+    def bucket(self, items):
+        transactions = defaultdict(TransactionBatch)
+        for key, fields in items:
+            transactions[key].append(*fields)
         return transactions
-        
     
-    def import_disc(self, filepath):
-        transactions = defaultdict(list)
+    
+    # import an html statement laid out as its bank's adapter describes
+    def import_statement(self, filepath, adapter, year):
+        if self.stream:
+            return self.bucket(self.stream_statement(filepath, adapter, year))
+        
         with open(filepath, "r") as in_file:
-            soup = BeautifulSoup(in_file.read(), "html.parser")
-            table = soup.find("table", {"id": "transactions-table"}).find("tbody")
-            for row in table.find_all("tr"):
-                if not row.get('id') or not re.match(r'transaction-\d+', row['id']):
-                    continue
-                
-                amount = float(row.find("td", {"class": "amt"}).text.replace("$", ""))
-                if amount < 0:
+            soup = parse_html(in_file.read())
+        rows = (adapter.read_row(row) for row in adapter.find_rows(soup))
+        return self.bucket(item for item in (adapter.parse(fields, year) for fields in rows) if item)
+    
+    # lazily yield a statement's transactions, reading each row's fields without building any document tree
+    def stream_statement(self, filepath, adapter, year):
+        streamer = RowStreamer(adapter.is_container, adapter.is_row, adapter.field_names)
+        for fields in streamer.stream(filepath):
+            item = adapter.parse(fields, year)
+            if item:
+                yield item
+    
+    # banks without an html adapter (SoFi, Bank of America) offer csv and OFX/QFX downloads, both read row by row
+    def import_download(self, filepath, source):
+        if filepath.lower().endswith((".ofx", ".qfx")):
+            return self.bucket(self.stream_ofx(filepath, source))
+        return self.bucket(self.stream_csv(filepath, source))
+    
+    # lazily yield transactions from a csv download, skipping any summary lines above the header
+    def stream_csv(self, filepath, source):
+        with open(filepath, "r", newline="") as in_file:
+            columns = None
+            for row in csv.reader(in_file):
+                if columns is None:
+                    columns = self.find_csv_columns(row)
                     continue
-                
-                date_str = row.find("td", {"class": "trans-date"}).text
-                date = datetime.strptime(date_str, "%m/%d/%y")
-                day, month, year = date.day, date.month, date.year
-                desc = row.find("td", {"class": "desc"}).find("a", {"class": "transaction-detail-toggler"}).text.strip()
-                category = row.find("td", {"class": "ctg"}).text
-                transactions[(month, year)].append(Transaction(f"{day} {month} {year}", desc, category, amount))
+                item = self.parse_csv_row(row, columns, source)
+                if item:
+                    yield item
+    
+    # {field: column index} if this row is the transactions header, otherwise None
+    def find_csv_columns(self, row):
+        names = [name.strip().lower() for name in row]
+        columns = {}
+        for field, aliases in CSV_COLUMNS.items():
+            for alias in aliases:
+                if alias in names:
+                    columns[field] = names.index(alias)
+                    break
+        if all(field in columns for field in ["date", "desc", "amount"]):
+            return columns
+        return None
+    
+    # parse a single csv row into ((month, year), (date, desc, category, amount, source)). debits are negative in these downloads
+    def parse_csv_row(self, row, columns, source):
+        if len(row) <= max(columns.values()):
+            return None
+        try:
+            amount = float(row[columns["amount"]].replace("$", "").replace(",", ""))
+        except ValueError:
+            # balance lines and other rows without an amount
+            return None
+        if amount >= 0:
+            return None
         
-        return transactions
+        txn_date = self.parse_csv_date(row[columns["date"]].strip())
+        desc = row[columns["desc"]].strip()
+        if not txn_date or not desc:
+            return None
+        
+        category = row[columns["category"]].strip() if "category" in columns else ""
+        return (txn_date.month, txn_date.year), (txn_date, desc, category or DEFAULT_CATEGORY, -amount, source)
+    
+    def parse_csv_date(self, value):
+        for date_format in CSV_DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+        return None
     
-    def import_sofi(self, filepath):
-        raise NotImplementedError("SoFi not implemented")
+    # lazily yield transactions from any bank's OFX/QFX download
+    def stream_ofx(self, filepath, source):
+        for fields in OfxStreamer().stream(filepath):
+            item = self.parse_ofx_row(fields, source)
+            if item:
+                yield item
     
-    def import_bofa(self, filepath):
-        raise NotImplementedError("Bofa not implemented")
+    # parse a single <STMTTRN> into ((month, year), (date, desc, category, amount, source)). debits have a negative TRNAMT
+    def parse_ofx_row(self, fields, source):
+        try:
+            amount = float(fields.get("TRNAMT", ""))
+            txn_date = datetime.strptime(fields.get("DTPOSTED", "")[:8], "%Y%m%d").date()
+        except ValueError:
+            return None
+        if amount >= 0:
+            return None
+        
+        desc = fields.get("NAME") or fields.get("MEMO")
+        if not desc:
+            return None
+        
+        return (txn_date.month, txn_date.year), (txn_date, desc, DEFAULT_CATEGORY, -amount, source)
     
     
-    # append transactions to a csv
+    # dedupe, categorize and write each month, returning the (month, year) keys that changed
     def export_transactions(self, transactions, salary, capital_gains, other_income):
-        for (month, year) in transactions:
+        # only the csvs predate per-month indexes; the ledger keeps its own fingerprints
+        legacy = FingerprintIndex(LEGACY_INDEX) if self.dedupe and not self.ledger and exists(LEGACY_INDEX) else None
+        incomes = [("Salary Income", "Salary", salary), ("Investments", "Investments", capital_gains), ("Other Income", "Other Income", other_income)]
+        exported = []
+        for month, year in sorted(transactions, key=lambda key: (key[1], key[0])):
+            if self.export_month(month, year, transactions[(month, year)], incomes, legacy):
+                exported.append((month, year))
+        if self.categorizer is not None:
+            self.categorizer.save()
+        return exported
+    
+    # one month as a single commit, holding only that month's lock (or the ledger's write lock): rows already
+    # recorded in the sink's own fingerprints are dropped, and the rest are written together with theirs
+    def export_month(self, month, year, batches, incomes, legacy=None):
+        if self.ledger:
+            with self.ledger.transaction():
+                index = FingerprintIndex()
+                index.fingerprints.update(self.ledger.fingerprints(month, year))
+                existing_incomes = self.ledger.incomes(month, year)
+                rows, replaced = self.month_rows(batches, incomes, existing_incomes, index if self.dedupe else None)
+                if not rows:
+                    return False
+                self.ledger.write(month, year, rows, index.pending, replaced)
+                if self.rollups:
+                    self.rollups.replace(month, year, self.ledger.rows(month, year), (None, self.ledger.partition_hash(month, year)))
+        else:
             out_filename = f"actual/{month}_{year}.csv"
-            add_header = False
-            if not exists(out_filename):
-                add_header = True
-            with open(out_filename, "a") as out_file:
-                writer = csv.writer(out_file)
-                if add_header:
-                    writer.writerow(["Date", "Description", "Category", "Amount"])
-                for t in sorted(transactions[(month, year)], key=lambda t: t.date):
-                    writer.writerow([t.date, t.desc, t.category, t.amt])
+            with FileLock(lock_path(out_filename)):
+                index = None
+                existing = self.read_csv(out_filename)
+                if self.dedupe:
+                    index = FingerprintIndex(month_index_path(month, year))
+                    # a csv from before per-month indexes gets one built from its rows, which carry no source
+                    if not exists(index.filepath):
+                        for fingerprint in index.row_fingerprints(existing):
+                            index.add(fingerprint)
+                    index.recover(out_filename)
+                existing_incomes = {category: amount for date_str, _, category, amount in existing if date_str == ""}
+                rows, replaced = self.month_rows(batches, incomes, existing_incomes, index, legacy)
+                if not rows:
+                    if index is not None:
+                        index.save()
+                    return False
+                kept = [row for row in existing if not (row[0] == "" and row[2] in replaced)]
+                self.write_csv(month, year, kept, rows, index)
+                # still under the month's lock, so the rollups describe exactly the csv just written
+                if self.rollups:
+                    self.rollups.replace(month, year, kept + rows, csv_source(out_filename))
+        return True
+    
+    # (new rows, income kinds they replace) for a month: each statement's rows not already in the index,
+    # categorized and in date order, then the income figures
+    def month_rows(self, batches, incomes, existing_incomes, index=None, legacy=None):
+        batch = TransactionBatch()
+        for statement in batches:
+            batch.extend(statement, self.dedupe_batch(statement, index, legacy) if index is not None else None)
+        if self.categorizer is None:
+            self.categorizer = Categorizer()
+        self.categorizer.apply(batch)
+        # sorted by the day ordinal, so "10 11 2023" no longer lands before "2 11 2023"
+        rows = list(batch.sorted().rows())
+        
+        # one row per (source, year, month, kind) of income: the same figure again is left alone,
+        # and a corrected one replaces the row already there
+        replaced = []
+        for desc, kind, amount in incomes:
+            if amount is None:
+                continue
+            if kind in existing_incomes:
+                if float(existing_incomes[kind]) == float(amount):
+                    continue
+                replaced.append(kind)
+            rows.append(("", desc, kind, amount, None))
+        return rows, replaced
+    
+    # a month csv's (date, description, category, amount) rows, without the header
+    def read_csv(self, filepath):
+        if not exists(filepath):
+            return []
+        with open(filepath, "r", newline="") as in_file:
+            reader = csv.reader(in_file)
+            next(reader, None)
+            return [tuple(row) for row in reader]
+    
+    # rewrite a month's csv as one commit: the kept rows and new ones go to a temp file, which then replaces
+    # the csv. a crash leaves either the old csv or the new one, never half of it. the caller holds the
+    # month's lock; the index's pending fingerprints are journalled against the new csv before the rename
+    def write_csv(self, month, year, existing, rows, index=None):
+        out_filename = f"actual/{month}_{year}.csv"
+        
+        def write(out_file):
+            writer = csv.writer(out_file)
+            writer.writerow(["Date", "Description", "Category", "Amount"])
+            writer.writerows(existing)
+            for date_str, desc, category, amt, _ in rows:
+                writer.writerow([date_str, desc, category, amt])
+        
+        if index is None:
+            write_atomic(out_filename, write, newline="")
+            return
+        write_atomic(out_filename, write, newline="", before_replace=lambda tmp_filepath: index.journal(BuildManifest.hash_file(tmp_filepath)))
+        index.save()
+
+
+# process pool entry point: parse one statement in a fresh importer
+def extract_statement(stream, source, filepath, year):
+    return Importer(stream=stream).extract(source, filepath, year)
 
-                # add salary figures
-                if salary != None:
-                    writer.writerow(["","Salary Income","Salary", salary])
-                if capital_gains != None:
-                    writer.writerow(["","Investments","Investments", capital_gains])
-                if other_income != None:
-                    writer.writerow(["","Other Income","Other Income", other_income])
         
 if __name__ == "__main__":
     i = Importer()
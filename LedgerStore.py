@@ -0,0 +1,324 @@
+import csv, os, re, sqlite3
+from contextlib import contextmanager
+from hashlib import blake2b
+from glob import glob
+from os.path import basename, exists
+from FingerprintIndex import FingerprintIndex, month_index_path
+
+COLUMNS = {
+    "Date": "CASE WHEN day IS NULL THEN NULL ELSE day || ' ' || month || ' ' || year END AS \"Date\"",
+    "Description": "description AS \"Description\"",
+    "Category": "category AS \"Category\"",
+    "Amount": "amount AS \"Amount\"",
+}
+# (month, year) the fingerprints of the csvs' old global index are kept under, since they could be from any month
+LEGACY_PERIOD = (0, 0)
+
+
+# typed, (year, month)-partitioned ledger backed by an indexed sqlite file.
+# an alternative to the actual/{month}_{year}.csv files that can be read back by partition and column.
+class LedgerStore:
+    def __init__(self, filepath="actual/ledger.db"):
+        self.filepath = filepath
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        # wait out other importers' write transactions instead of failing, and let readers run alongside them
+        self.conn = sqlite3.connect(filepath, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        has_fingerprints = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'fingerprints'").fetchone() is not None
+        has_search = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'transactions_search'").fetchone() is not None
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS transactions (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                day INTEGER,
+                description TEXT NOT NULL,
+                category TEXT NOT NULL,
+                amount REAL NOT NULL,
+                source TEXT
+            );
+            CREATE INDEX IF NOT EXISTS transactions_partition ON transactions (year, month);
+            CREATE INDEX IF NOT EXISTS transactions_date ON transactions (year, month, day);
+            CREATE INDEX IF NOT EXISTS transactions_category ON transactions (category, year, month);
+            DROP INDEX IF EXISTS transactions_description;
+            CREATE VIRTUAL TABLE IF NOT EXISTS transactions_search USING fts5(
+                description, content='transactions', content_rowid='rowid', tokenize='trigram'
+            );
+            CREATE TRIGGER IF NOT EXISTS transactions_search_insert AFTER INSERT ON transactions BEGIN
+                INSERT INTO transactions_search (rowid, description) VALUES (new.rowid, new.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS transactions_search_delete AFTER DELETE ON transactions BEGIN
+                INSERT INTO transactions_search (transactions_search, rowid, description) VALUES ('delete', old.rowid, old.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS transactions_search_update AFTER UPDATE OF description ON transactions BEGIN
+                INSERT INTO transactions_search (transactions_search, rowid, description) VALUES ('delete', old.rowid, old.description);
+                INSERT INTO transactions_search (rowid, description) VALUES (new.rowid, new.description);
+            END;
+            CREATE TABLE IF NOT EXISTS synced_csvs (filepath TEXT PRIMARY KEY, hash TEXT NOT NULL, stat TEXT);
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                PRIMARY KEY (year, month, fingerprint)
+            ) WITHOUT ROWID;
+        """)
+        # the ledger keeps its own fingerprints, committed with its rows. ledgers from before that get them
+        # recomputed from the rows already stored
+        if not has_fingerprints:
+            with self.conn:
+                for month, year in self.periods():
+                    self.add_fingerprints(month, year, self.row_fingerprints(self.rows(month, year)))
+        # mirrors synced before file stats were kept hash each csv once more on their next sync
+        if "stat" not in [column for _, column, *_ in self.conn.execute("PRAGMA table_info(synced_csvs)")]:
+            with self.conn:
+                self.conn.execute("ALTER TABLE synced_csvs ADD COLUMN stat TEXT")
+        # the description search index is kept up to date by the triggers above, once built for existing rows
+        if not has_search:
+            with self.conn:
+                self.conn.execute("INSERT INTO transactions_search (transactions_search) VALUES ('rebuild')")
+
+    def close(self):
+        self.conn.close()
+
+
+    # ------------ WRITE ------------
+    # hold the ledger's write lock from before a month is deduped until its rows and fingerprints are committed
+    @contextmanager
+    def transaction(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield self
+        except BaseException:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
+    # append (date, description, category, amount, source) rows to a month's partition, along with the
+    # fingerprints of the new transactions. income kinds in replaced lose their old undated rows first
+    def write(self, month, year, rows, fingerprints=(), replaced=()):
+        if replaced:
+            self.conn.execute(
+                f"DELETE FROM transactions WHERE year = ? AND month = ? AND day IS NULL AND source IS NULL AND category IN ({', '.join('?' * len(replaced))})",
+                (year, month, *replaced)
+            )
+        self.conn.executemany(
+            "INSERT INTO transactions (year, month, day, description, category, amount, source) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(year, month, self.parse_day(date), desc, category, float(amt), source) for date, desc, category, amt, source in rows]
+        )
+        self.add_fingerprints(month, year, fingerprints)
+
+    def add_fingerprints(self, month, year, fingerprints):
+        self.conn.executemany("INSERT OR IGNORE INTO fingerprints (year, month, fingerprint) VALUES (?, ?, ?)", [(year, month, fingerprint) for fingerprint in fingerprints])
+
+    # replace a month's partition entirely, along with any fingerprints recorded for it elsewhere
+    def replace(self, month, year, rows, fingerprints=()):
+        rows = list(rows)
+        with self.conn:
+            self.delete(month, year)
+            self.write(month, year, rows, self.row_fingerprints(rows))
+            self.add_fingerprints(month, year, fingerprints)
+
+    # remove a month's partition and its fingerprints
+    def delete(self, month, year):
+        self.conn.execute("DELETE FROM transactions WHERE year = ? AND month = ?", (year, month))
+        self.conn.execute("DELETE FROM fingerprints WHERE year = ? AND month = ?", (year, month))
+
+    def row_fingerprints(self, rows):
+        return FingerprintIndex().row_fingerprints(rows)
+
+    # dates are stored as "day month year" strings elsewhere; keep only the day since the partition holds the rest
+    def parse_day(self, date):
+        if date is None or str(date).strip() == "":
+            return None
+        return int(str(date).split()[0])
+
+
+    # ------------ READ ------------
+    # a month's rows as (date, description, category, amount, source) tuples, dates as "day month year"
+    def rows(self, month, year):
+        return self.conn.execute(
+            "SELECT CASE WHEN day IS NULL THEN '' ELSE day || ' ' || month || ' ' || year END, description, category, amount, source FROM transactions WHERE year = ? AND month = ? ORDER BY rowid",
+            (year, month)
+        ).fetchall()
+
+    # fingerprints of the transactions stored for a month, and of any migrated from the csvs' old global index
+    def fingerprints(self, month, year):
+        legacy_month, legacy_year = LEGACY_PERIOD
+        return {fingerprint for fingerprint, in self.conn.execute(
+            "SELECT fingerprint FROM fingerprints WHERE (year = ? AND month = ?) OR (year = ? AND month = ?)", (year, month, legacy_year, legacy_month)
+        )}
+
+    # {kind: amount} of a month's manually entered income rows
+    def incomes(self, month, year):
+        return dict(self.conn.execute("SELECT category, amount FROM transactions WHERE year = ? AND month = ? AND day IS NULL AND source IS NULL", (year, month)).fetchall())
+
+    # read one month as a dataframe shaped like its csv
+    def read(self, month, year, columns=("Date", "Description", "Category", "Amount")):
+        return self.read_months([(month, year)], columns)
+
+    # read several (month, year) partitions; only the requested columns are selected
+    def read_months(self, periods, columns=("Date", "Description", "Category", "Amount"), with_period=False):
+        import pandas as pd
+        select = [COLUMNS[column] for column in columns]
+        if with_period:
+            select = ["year AS \"Year\"", "month AS \"Month\""] + select
+
+        periods = list(periods)
+        if not periods:
+            return pd.DataFrame(columns=(["Year", "Month"] if with_period else []) + list(columns))
+
+        where = " OR ".join(["(year = ? AND month = ?)"] * len(periods))
+        params = [value for month, year in periods for value in (year, month)]
+        query = f"SELECT {', '.join(select)} FROM transactions WHERE {where} ORDER BY year, month, rowid"
+        return pd.read_sql_query(query, self.conn, params=params)
+
+    # (month, year) partitions that hold any rows
+    def periods(self):
+        rows = self.conn.execute("SELECT DISTINCT month, year FROM transactions ORDER BY year, month").fetchall()
+        return [(month, year) for month, year in rows]
+
+    # content hash of a month's rows, for change detection
+    def partition_hash(self, month, year):
+        h = blake2b(digest_size=16)
+        rows = self.conn.execute("SELECT day, description, category, amount, source FROM transactions WHERE year = ? AND month = ? ORDER BY rowid", (year, month))
+        for row in rows:
+            h.update(repr(row).encode())
+        return h.hexdigest()
+
+    def has(self, month, year):
+        return self.conn.execute("SELECT 1 FROM transactions WHERE year = ? AND month = ? LIMIT 1", (year, month)).fetchone() is not None
+
+
+    # ------------ QUERY ------------
+    # stream transactions, or per-group totals, matching the given filters.
+    # start and end are inclusive (year, month, day) tuples; mappings relabel bank categories as reports do.
+    # returns (column names, cursor)
+    def query(self, start=None, end=None, categories=None, min_amount=None, max_amount=None, contains=None, group_by=None, top=None, mappings=None):
+        mappings = mappings or {}
+        category = "category"
+        if mappings:
+            with self.conn:
+                self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS category_mappings (raw TEXT PRIMARY KEY, mapped TEXT NOT NULL)")
+                self.conn.execute("DELETE FROM temp.category_mappings")
+                self.conn.executemany("INSERT INTO temp.category_mappings (raw, mapped) VALUES (?, ?)", mappings.items())
+            category = "COALESCE((SELECT mapped FROM temp.category_mappings WHERE raw = category), category)"
+
+        where, params = [], []
+        # whole months narrow through the date index, then the first and last month are trimmed to the day
+        if start:
+            where.append("(year, month) >= (?, ?) AND (year, month, COALESCE(day, 1)) >= (?, ?, ?)")
+            params.extend([start[0], start[1], *start])
+        if end:
+            where.append("(year, month) <= (?, ?) AND (year, month, COALESCE(day, 1)) <= (?, ?, ?)")
+            params.extend([end[0], end[1], *end])
+        if categories:
+            # match the bank categories that map onto each requested category, so the category index is used
+            raw = set(categories) | {raw for raw, mapped in mappings.items() if mapped in categories}
+            where.append(f"category IN ({', '.join('?' * len(raw))})")
+            params.extend(sorted(raw))
+        if min_amount is not None:
+            where.append("amount >= ?")
+            params.append(min_amount)
+        if max_amount is not None:
+            where.append("amount <= ?")
+            params.append(max_amount)
+        # substrings of three or more characters are looked up in the trigram index; shorter ones,
+        # which have no trigram to look up, scan the descriptions
+        if contains and len(contains) >= 3:
+            where.append("rowid IN (SELECT rowid FROM transactions_search WHERE transactions_search MATCH ?)")
+            params.append('"' + contains.replace('"', '""') + '"')
+        elif contains:
+            where.append("description LIKE ? ESCAPE '\\'")
+            params.append("%" + re.sub(r"([\\%_])", r"\\\1", contains) + "%")
+
+        groups = {
+            "category": category,
+            "description": "description",
+            "month": "printf('%04d-%02d', year, month)",
+            "year": "year",
+            "source": "source",
+        }
+        if group_by:
+            columns = [name.capitalize() for name in group_by] + ["Total", "Count"]
+            select = [f"{groups[name]} AS \"{name.capitalize()}\"" for name in group_by] + ["ROUND(SUM(amount), 2) AS \"Total\"", "COUNT(*) AS \"Count\""]
+            order = "\"Total\" DESC" if top else ", ".join(f"\"{name.capitalize()}\"" for name in group_by)
+            tail = f"GROUP BY {', '.join(str(i + 1) for i in range(len(group_by)))} ORDER BY {order}"
+        else:
+            columns = ["Date", "Description", "Category", "Amount", "Source"]
+            select = [
+                "CASE WHEN day IS NULL THEN NULL ELSE printf('%04d-%02d-%02d', year, month, day) END AS \"Date\"",
+                "description AS \"Description\"", f"{category} AS \"Category\"", "amount AS \"Amount\"", "source AS \"Source\"",
+            ]
+            tail = "ORDER BY amount DESC" if top else "ORDER BY year, month, day, rowid"
+        if top:
+            tail += f" LIMIT {int(top)}"
+
+        query = f"SELECT {', '.join(select)} FROM transactions {'WHERE ' + ' AND '.join(where) if where else ''} {tail}"
+        return columns, self.conn.execute(query, params)
+
+
+    # ------------ MIGRATION ------------
+    # one-shot load of every actual/{month}_{year}.csv into the ledger, replacing those partitions.
+    # the csvs do not say which bank each row came from, so the fingerprints imports recorded for them
+    # are copied over from their indexes for re-imports to match against
+    def migrate(self, csv_dir="actual"):
+        legacy = FingerprintIndex(f"{csv_dir}/.fingerprints")
+        with self.conn:
+            self.add_fingerprints(*LEGACY_PERIOD, legacy.fingerprints)
+
+        migrated = []
+        for filepath, month, year in self.month_csvs(csv_dir):
+            index = FingerprintIndex(month_index_path(month, year, csv_dir))
+            index.recover(filepath)
+            self.replace(month, year, self.read_csv(filepath), index.fingerprints)
+            migrated.append((month, year))
+        return migrated
+
+    # keep the ledger a mirror of the csvs, reloading only the months whose csv changed since the last sync
+    # and dropping those whose csv is gone. a csv is only hashed when its stat moved, so a sync with nothing
+    # new reads no csv. returns the months reloaded or dropped
+    def sync(self, csv_dir="actual"):
+        from BuildManifest import BuildManifest
+        synced = {filepath: (file_hash, stat) for filepath, file_hash, stat in self.conn.execute("SELECT filepath, hash, stat FROM synced_csvs")}
+        changed = []
+        for filepath, month, year in self.month_csvs(csv_dir):
+            file_hash, stat = synced.get(filepath, (None, None))
+            file_stat = BuildManifest.stat_file(filepath)
+            if file_stat == stat:
+                continue
+            new_hash = BuildManifest.hash_file(filepath)
+            if new_hash != file_hash:
+                self.replace(month, year, self.read_csv(filepath))
+                changed.append((month, year))
+            with self.conn:
+                self.conn.execute("INSERT OR REPLACE INTO synced_csvs (filepath, hash, stat) VALUES (?, ?, ?)", (filepath, new_hash, file_stat))
+
+        for filepath in synced:
+            period = self.month_csv(filepath)
+            if exists(filepath) or period is None:
+                continue
+            with self.conn:
+                self.delete(*period)
+                self.conn.execute("DELETE FROM synced_csvs WHERE filepath = ?", (filepath,))
+            changed.append(period)
+        return changed
+
+    def month_csvs(self, csv_dir):
+        for filepath in sorted(glob(f"{csv_dir}/*.csv")):
+            period = self.month_csv(filepath)
+            if period:
+                yield filepath, *period
+
+    # (month, year) a month csv holds, or None for any other file
+    def month_csv(self, filepath):
+        match = re.fullmatch(r"(\d{1,2})_(\d{4})\.csv", basename(filepath))
+        return (int(match.group(1)), int(match.group(2))) if match else None
+
+    def read_csv(self, filepath):
+        with open(filepath, "r") as in_file:
+            return [(row["Date"], row["Description"], row["Category"], row["Amount"], None) for row in csv.DictReader(in_file)]
+
+
+if __name__ == "__main__":
+    ledger = LedgerStore()
+    periods = ledger.migrate()
+    print(f"Migrated {len(periods)} months into {ledger.filepath}")
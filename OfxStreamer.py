@@ -0,0 +1,39 @@
+import re
+from html import unescape
+
+# a tag and the text up to the next tag. OFX 1.x is SGML and leaves leaf tags unclosed, 2.x is XML and closes them
+TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+# incrementally walk an OFX/QFX download and yield each <STMTTRN> as a {TAG: value} dict.
+# only the transaction currently being read is held in memory, so multi-year downloads stay flat.
+class OfxStreamer:
+    def __init__(self, chunk_size=64 * 1024):
+        self.chunk_size = chunk_size
+        self.fields = None
+
+
+    # yield the fields of every transaction in the file
+    def stream(self, filepath):
+        self.fields = None
+        buffer = ""
+        with open(filepath, "r", errors="replace") as in_file:
+            while chunk := in_file.read(self.chunk_size):
+                buffer += chunk
+                # a tag's value runs up to the next "<", so anything after the last one may continue in the next chunk
+                cut = buffer.rfind("<")
+                if cut <= 0:
+                    continue
+                yield from self.records(buffer[:cut])
+                buffer = buffer[cut:]
+            yield from self.records(buffer)
+
+    def records(self, text):
+        for closing, tag, value in TAG.findall(text):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and self.fields is not None:
+                    yield self.fields
+                self.fields = None if closing else {}
+            elif self.fields is not None and not closing:
+                self.fields[tag] = unescape(value.strip())
@@ -0,0 +1,151 @@
+import cProfile, functools, json, os, re, time, tracemalloc
+from collections import defaultdict
+
+# methods timed when profiling is on. the rest of the code carries no hooks,
+# so a run without --timings/--profile pays nothing at all.
+# the scoped methods start a new per-statement or per-month breakdown
+PIPELINE = {
+    "Importer": {
+        "scoped": {"extract": lambda source, filepath, year=None: f"statement:{os.path.basename(filepath)}"},
+        "methods": ["import_statement", "import_download", "parse_csv_row", "parse_ofx_row", "merge_transactions", "dedupe_batch", "export_transactions", "export_month", "write_csv"],
+    },
+    "Categorizer": {
+        "methods": ["apply"],
+    },
+    "Reporter": {
+        "scoped": {"render_report": lambda month, year, *_: f"month:{month.value[0]}_{year}"},
+        "methods": ["split_spend_income", "split_df", "load_actual", "load_target", "load_actual_range", "build_model", "create_report", "run_many",
+                    "create_forecast", "create_spend_piechart", "create_cumulative_linechart", "create_per_category_barchart", "create_totals_barchart",
+                    "generate_sankeymatic_chart", "figure_html", "write_report", "create_trend_report"],
+    },
+}
+
+
+# per-stage wall time, call counts and peak memory, grouped by the statement or month being processed
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        self.cprofile_dir = None
+        self.stats = defaultdict(lambda: {"calls": 0, "seconds": 0.0, "peak_bytes": 0})
+        self.stack = []
+        self.scope = "run"
+        self.started = None
+
+    def enable(self, memory=True, cprofile_dir=None):
+        self.enabled = True
+        self.memory = memory
+        self.cprofile_dir = cprofile_dir
+        self.started = time.perf_counter()
+        if cprofile_dir:
+            os.makedirs(cprofile_dir, exist_ok=True)
+        if memory:
+            tracemalloc.start()
+
+    # wrap the listed methods of each pipeline class with timing
+    def instrument(self, *classes):
+        for cls in classes:
+            spec = PIPELINE.get(cls.__name__, {})
+            for name, scope_fn in spec.get("scoped", {}).items():
+                setattr(cls, name, self.wrap(f"{cls.__name__}.{name}", getattr(cls, name), scope_fn))
+            for name in spec.get("methods", []):
+                setattr(cls, name, self.wrap(f"{cls.__name__}.{name}", getattr(cls, name)))
+
+    def wrap(self, stage, fn, scope_fn=None):
+        @functools.wraps(fn)
+        def timed(instance, *args, **kwargs):
+            scope = scope_fn(*args, **kwargs) if scope_fn else None
+            with self.stage(stage, scope):
+                return fn(instance, *args, **kwargs)
+        return timed
+
+    # time a block; a scope relabels it and everything nested inside it
+    def stage(self, name, scope=None):
+        return Stage(self, name, scope) if self.enabled else NULL_STAGE
+
+    def enter(self, frame):
+        if frame.scope:
+            frame.outer_scope, self.scope = self.scope, frame.scope
+            if self.cprofile_dir:
+                frame.cprofile = cProfile.Profile()
+                frame.cprofile.enable()
+        if self.memory:
+            # hand the peak so far to the enclosing stage before measuring this one on its own
+            if self.stack:
+                self.stack[-1].child_peak = max(self.stack[-1].child_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        self.stack.append(frame)
+        frame.start = time.perf_counter()
+
+    def exit(self, frame):
+        seconds = time.perf_counter() - frame.start
+        self.stack.pop()
+        peak = 0
+        if self.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], frame.child_peak)
+            if self.stack:
+                self.stack[-1].child_peak = max(self.stack[-1].child_peak, peak)
+
+        stats = self.stats[(self.scope, frame.name)]
+        stats["calls"] += 1
+        stats["seconds"] += seconds
+        stats["peak_bytes"] = max(stats["peak_bytes"], peak)
+
+        if frame.scope:
+            if frame.cprofile:
+                frame.cprofile.disable()
+                frame.cprofile.dump_stats(os.path.join(self.cprofile_dir, re.sub(r"[^\w.-]", "_", frame.scope) + ".prof"))
+            self.scope = frame.outer_scope
+
+    def summary(self):
+        stages = [
+            {"scope": scope, "stage": name, "calls": stats["calls"], "seconds": round(stats["seconds"], 6), "peak_bytes": stats["peak_bytes"] if self.memory else None}
+            for (scope, name), stats in self.stats.items()
+        ]
+        return {
+            "total_seconds": round(time.perf_counter() - self.started, 6) if self.started else None,
+            "memory": self.memory,
+            "stages": sorted(stages, key=lambda s: (s["scope"], -s["seconds"])),
+        }
+
+    def save(self, filepath):
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        with open(filepath, "w") as out_file:
+            json.dump(self.summary(), out_file, indent=2)
+
+    # one line per stage, slowest first within each scope
+    def report(self):
+        for stage in self.summary()["stages"]:
+            peak = f"{stage['peak_bytes'] / 2**20:.1f} MiB" if stage["peak_bytes"] is not None else ""
+            print(f"{stage['scope']:<28} {stage['stage']:<40} {stage['calls']:>8} calls {stage['seconds']:>10.4f}s {peak:>12}")
+
+
+class Stage:
+    def __init__(self, profiler, name, scope):
+        self.profiler = profiler
+        self.name = name
+        self.scope = scope
+        self.outer_scope = None
+        self.cprofile = None
+        self.child_peak = 0
+        self.start = 0.0
+
+    def __enter__(self):
+        self.profiler.enter(self)
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.exit(self)
+        return False
+
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = NullStage()
+profiler = Profiler()
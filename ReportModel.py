@@ -0,0 +1,57 @@
+import pandas as pd
+from calendar import monthrange
+
+# categories matching this are income, everything else is spend
+INCOME_PATTERN = "income|salary|invest"
+
+
+# which of the given (distinct) categories are income. the regex runs once per category, never per transaction
+def income_categories(categories):
+    categories = pd.Index(categories)
+    return categories[categories.astype(str).str.contains(INCOME_PATTERN, case=False, regex=True)]
+
+
+# every number a month's report is drawn from, computed once from its transactions and targets.
+# actual has Date, Category and Amount columns and target has Category and Amount, both with categories
+# already mapped. actual_totals, when given, are the per-category sums of actual already computed for a
+# range of months. figures and blurbs only read from a model, so any other output format can reuse it
+class ReportModel:
+    def __init__(self, month, year, actual, target, actual_totals=None):
+        self.month = month
+        self.year = year
+        self.days_in_month = monthrange(year, month.value[0])[1]
+
+        # per-category sums, one groupby each, then split into income and spend on the distinct categories
+        if actual_totals is None:
+            actual_totals = actual.groupby("Category")["Amount"].sum()
+        target_totals = target.groupby("Category")["Amount"].sum()
+        income = income_categories(actual_totals.index.union(target_totals.index))
+        actual_is_income = actual_totals.index.isin(income)
+        target_is_income = target_totals.index.isin(income)
+        self.actual_income = actual_totals[actual_is_income]
+        self.actual_spend = actual_totals[~actual_is_income]
+        self.target_income = target_totals[target_is_income]
+        self.target_spend = target_totals[~target_is_income]
+
+        self.total_actual_income = self.actual_income.sum()
+        self.total_actual_spend = self.actual_spend.sum()
+        self.total_target_income = self.target_income.sum()
+        self.total_target_spend = self.target_spend.sum()
+        self.top_spend = self.actual_spend.nlargest(3)
+
+        # target vs. actual per category. diff is how far on the good side of target each category landed:
+        # under target for spend, over it for income
+        comparison = pd.DataFrame({"Target": target_totals, "Actual": actual_totals}).fillna(0).sort_index()
+        diff = (comparison["Target"] - comparison["Actual"]).round(2)
+        comparison["Diff"] = diff.where(~comparison.index.isin(income), -diff)
+        self.comparison = comparison.rename_axis("Category").reset_index()
+
+        # running spend through the month, in date order
+        spend = actual[~actual["Category"].isin(income)]
+        dates = spend["Date"]
+        if not pd.api.types.is_datetime64_any_dtype(dates):
+            dates = pd.to_datetime(dates, format="%d %m %Y")
+        dates = dates.to_numpy()
+        order = dates.argsort(kind="stable")
+        self.cumulative = pd.Series(spend["Amount"].to_numpy()[order].cumsum(), index=dates[order])
+        self.total_spend = self.cumulative.iloc[-1] if len(self.cumulative) else 0
@@ -0,0 +1,177 @@
+import re
+from collections import OrderedDict
+from glob import glob
+from html import escape
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from os.path import basename, exists
+from BuildManifest import BuildManifest
+from classes import Month
+
+REPORT_PATH = re.compile(r"/(\d{1,2})_(\d{4})\.html")
+ASSET_PATH = re.compile(r"/(plotly-[\w.-]+\.min\.js)")
+
+
+# rendered pages keyed by (month, year), evicting the least recently served once over max_bytes
+class PageCache:
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = max_bytes
+        self.pages = OrderedDict()
+        self.size = 0
+
+    def __len__(self):
+        return len(self.pages)
+
+    # the cached body if it was rendered from inputs with this etag
+    def get(self, key, etag):
+        page = self.pages.get(key)
+        if page is None or page[0] != etag:
+            return None
+        self.pages.move_to_end(key)
+        return page[1]
+
+    def put(self, key, etag, body):
+        self.discard(key)
+        if len(body) > self.max_bytes:
+            return
+        self.pages[key] = (etag, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self.pages.popitem(last=False)
+            self.size -= len(evicted)
+
+    def discard(self, key):
+        page = self.pages.pop(key, None)
+        if page:
+            self.size -= len(page[1])
+
+    def clear(self):
+        self.pages.clear()
+        self.size = 0
+
+
+# serves reports over local http, rendering each month the first time it is asked for.
+# a page's etag is the hash of its report inputs, so changed actual/, goals/ or settings.json files
+# invalidate both the in-memory copy and the browser's
+class ReportServer:
+    def __init__(self, ledger=None, offline=False, cache_bytes=64 * 2**20):
+        self.ledger = ledger
+        self.offline = offline
+        self.cache = PageCache(cache_bytes)
+        self.reporter = None
+        self.settings_hash = None
+
+    # a Reporter holding the current settings.json, rebuilt whenever the file changes
+    def get_reporter(self):
+        settings_hash = BuildManifest.hash_file("settings.json")
+        if self.reporter is None or settings_hash != self.settings_hash:
+            from Reporter import Reporter
+            self.reporter = Reporter(ledger=self.ledger, offline=self.offline)
+            self.settings_hash = settings_hash
+            self.cache.clear()
+        return self.reporter
+
+    def has_actual(self, month, year):
+        if self.ledger and self.ledger.has(month.value[0], year):
+            return True
+        return exists(f"actual/{month.value[0]}_{year}.csv")
+
+    # (etag, html) for a month's report, or None if there is nothing to report on
+    def page(self, month, year):
+        if not self.has_actual(month, year):
+            return None
+
+        reporter = self.get_reporter()
+        etag = f'"{BuildManifest.hash_value(reporter.report_inputs(month, year))}"'
+        body = self.cache.get((month, year), etag)
+        if body is None:
+            # only renders if reports/ does not already hold a copy built from these inputs
+            reporter.create_report(month, year)
+            with open(f"reports/{month.value[0]}_{year}.html", "rb") as in_file:
+                body = in_file.read()
+            self.cache.put((month, year), etag, body)
+        return etag, body
+
+    # every month with actual data, newest first
+    def periods(self):
+        periods = set(self.ledger.periods()) if self.ledger else set()
+        for filepath in glob("actual/*.csv"):
+            match = re.fullmatch(r"(\d{1,2})_(\d{4})\.csv", basename(filepath))
+            if match:
+                periods.add((int(match.group(1)), int(match.group(2))))
+        return sorted(periods, key=lambda p: (p[1], p[0]), reverse=True)
+
+    def index(self):
+        links = "\n".join(
+            f'<li><a href="/{month}_{year}.html">{escape(Month.from_value(month).value[2])} {year}</a></li>'
+            for month, year in self.periods()
+        )
+        return f"""<!DOCTYPE html>
+        <html>
+        <head><title>Reports</title></head>
+        <body style="font-family: verdana, georgia;">
+            <h2>Reports</h2>
+            <ul>{links}</ul>
+        </body>
+        </html>""".encode()
+
+    def serve(self, host="127.0.0.1", port=8000):
+        httpd = HTTPServer((host, port), ReportHandler)
+        httpd.report_server = self
+        print(f"Serving reports on http://{host}:{port}/, press Ctrl+C to stop")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            print("Stopped serving")
+        finally:
+            httpd.server_close()
+
+
+class ReportHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server.report_server
+        path = self.path.split("?", 1)[0]
+
+        if path == "/":
+            return self.respond(200, server.index())
+
+        if match := ASSET_PATH.fullmatch(path):
+            filepath = f"reports/{match.group(1)}"
+            if not exists(filepath):
+                return self.respond(404, b"Not found")
+            with open(filepath, "rb") as in_file:
+                # the bundle is versioned by filename, so it never changes in place
+                return self.respond(200, in_file.read(), "application/javascript", {"Cache-Control": "max-age=31536000, immutable"})
+
+        match = REPORT_PATH.fullmatch(path)
+        if not match:
+            return self.respond(404, b"Not found")
+        try:
+            month, year = Month.from_value(match.group(1)), int(match.group(2))
+        except ValueError:
+            return self.respond(404, b"Not found")
+
+        try:
+            page = server.page(month, year)
+        # Reporter exits on missing inputs, which must not take the server down with it
+        except (Exception, SystemExit) as e:
+            self.log_error("Could not render %s: %r", path, e)
+            return self.respond(500, b"Could not render report")
+        if page is None:
+            return self.respond(404, f"No actual data for {month.value[2]} {year}".encode())
+
+        etag, body = page
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+            return self.respond(304, b"", headers=headers)
+        return self.respond(200, body, headers=headers)
+
+    def respond(self, status, body, content_type="text/html; charset=utf-8", headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if status != 304:
+            self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
@@ -1,17 +1,39 @@
-import re, json
+import json, os
 import pandas as pd
+import plotly
 import plotly.express as px
 import plotly.io as pio
 import plotly.graph_objects as go
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from classes import Month
 from calendar import monthrange
 from os.path import exists
+from concurrent.futures import ProcessPoolExecutor
+from BuildManifest import BuildManifest
+from FileLock import write_atomic
+from RollupCache import RollupCache
+from Forecaster import Forecaster
+from ReportModel import ReportModel, income_categories
 
 class Reporter:
-    def __init__(self):
+    def __init__(self, ledger=None, force=False, offline=False, rollups=None):
         self.category_mappings = {}
         self.category_colors = {}
+        # optional LedgerStore to read actuals from instead of the per-month csvs
+        self.ledger = ledger
+        # RollupCache for multi-month trend reports and forecasts, opened on first use
+        self.rollups = rollups
+        self.rollups_refreshed = False
+        self.forecaster = Forecaster()
+        # settings.json budget split, loaded on first use and shared across months
+        self.default_target = None
+        # rebuild reports even when their inputs are unchanged
+        self.force = force
+        self.manifest = BuildManifest()
+        # write plotly.js once into reports/ and embed only figure json in each report
+        self.offline = offline
+        self.pending_figures = []
+        self.settings_hashes = {}
         
         settings = "settings.json"
         if exists(settings):
@@ -19,6 +41,7 @@ class Reporter:
                 mappings = json.load(file)
                 self.category_mappings = mappings["Mappings"]
                 self.category_colors = mappings["Colors"]
+                self.settings_hashes = {section: BuildManifest.hash_value(mappings.get(section)) for section in ["Mappings", "Colors", "Budget"]}
     
     # ------------ HELPERS ------------
     # import data and split into income and expenses
@@ -37,53 +60,149 @@ class Reporter:
             else:
                 continue
             
-            df["Category"] = df["Category"].replace(self.category_mappings)
-            df_income = df[df["Category"].str.contains("income|salary|invest", case=False, regex=True)]
-            df_spend = df[~df["Category"].str.contains("income|salary|invest", case=False, regex=True)]
-            return df, df_income, df_spend
+            return self.split_df(df)
             
         print(f"Could not find any existing files: {', '.join(filepaths)}")
         exit(1)
     
+    # map categories and split a loaded frame into income and expenses
+    def split_df(self, df):
+        df = self.map_categories(df)
+        is_income = df["Category"].isin(income_categories(df["Category"].unique()))
+        return df, df[is_income], df[~is_income]
+    
+    # replace categories with their settings.json mappings
+    def map_categories(self, df):
+        df["Category"] = df["Category"].replace(self.category_mappings)
+        return df
+    
+    # load a month's actuals from the ledger if it has them, otherwise from its csv, with categories mapped
+    def load_actual(self, month, year):
+        if self.ledger and self.ledger.has(month.value[0], year):
+            return self.map_categories(self.ledger.read(month.value[0], year, columns=("Date", "Category", "Amount")))
+        filepath = f"actual/{month.value[0]}_{year}.csv"
+        if not exists(filepath):
+            print(f"Could not find any existing files: {filepath}")
+            exit(1)
+        return self.map_categories(pd.read_csv(filepath, usecols=["Date", "Category", "Amount"]))
+    
+    # html for a figure: a standalone cdn snippet, or a placeholder div filled in by the report's bootstrap script
+    def figure_html(self, fig):
+        if not self.offline:
+            return pio.to_html(fig, full_html=False, include_plotlyjs="cdn")
+        
+        # every figure carries the same default template, so it is stored once per report
+        figure = json.loads(pio.to_json(fig, validate=False, pretty=False))
+        template = figure["layout"].pop("template", None)
+        div_id = f"figure-{len(self.pending_figures)}"
+        self.pending_figures.append((div_id, figure, template))
+        return f'<div id="{div_id}" class="plotly-graph-div"></div>'
+    
+    def plotlyjs_filename(self):
+        return f"plotly-{plotly.__version__}.min.js"
+    
+    # write the shared plotly.js bundle next to the reports if it is not there yet
+    def write_plotlyjs(self):
+        filepath = f"reports/{self.plotlyjs_filename()}"
+        if exists(filepath):
+            return
+        
+        from plotly.offline import get_plotlyjs
+        tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_filepath, "w") as out_file:
+            out_file.write(get_plotlyjs())
+        os.replace(tmp_filepath, filepath)
+    
+    # head tag and bootstrap script that render every pending figure with the shared bundle
+    def figure_scripts(self):
+        if not self.offline:
+            return "", ""
+        
+        templates = []
+        figures = []
+        for div_id, figure, template in self.pending_figures:
+            if template not in templates:
+                templates.append(template)
+            figures.append({"id": div_id, "figure": figure, "template": templates.index(template)})
+        payload = json.dumps({"templates": templates, "figures": figures}, separators=(",", ":")).replace("</", "<\\/")
+        
+        head = f'<script src="{self.plotlyjs_filename()}"></script>'
+        body = f"""<script type="application/json" id="report-figures">{payload}</script>
+            <script>
+                var report = JSON.parse(document.getElementById("report-figures").textContent);
+                report.figures.forEach(function (f) {{
+                    var layout = f.figure.layout;
+                    if (report.templates[f.template]) layout.template = report.templates[f.template];
+                    Plotly.newPlot(f.id, f.figure.data, layout, {{responsive: true}});
+                }});
+            </script>"""
+        self.pending_figures = []
+        return head, body
+    
     def round_money(self, money):
         return round(money, 2)
     
+    # the rollups, first recomputing any month whose transactions changed since they were rolled up
+    def get_rollups(self):
+        if self.rollups is None:
+            self.rollups = RollupCache()
+        if not self.rollups_refreshed:
+            self.rollups.refresh(ledger=self.ledger)
+            self.rollups_refreshed = True
+        return self.rollups
+
+    # trailing mean over the given number of calendar months of a (Year, Month) indexed series. months
+    # missing from the series are skipped rather than counted, and never widen the window past that many months
+    @staticmethod
+    def rolling_average(monthly, months=3):
+        first, last = monthly.index[0], monthly.index[-1]
+        calendar_months = pd.MultiIndex.from_tuples(
+            [(i // 12, i % 12 + 1) for i in range(first[0] * 12 + first[1] - 1, last[0] * 12 + last[1])],
+            names=monthly.index.names)
+        return monthly.reindex(calendar_months).rolling(months, min_periods=1).mean().reindex(monthly.index)
+    
+    # the date a month's forecast is made from: today for the current month, the last day for past months
+    def forecast_as_of(self, month, year):
+        today = date.today()
+        if (year, month.value[0]) > (today.year, today.month):
+            return None
+        as_of = today if (year, month.value[0]) == (today.year, today.month) else date(year, month.value[0], monthrange(year, month.value[0])[1])
+        # nothing is left to project at the end of the year
+        if (as_of.month, as_of.day) == (12, 31):
+            return None
+        return as_of
+    
+    # (start, end) months of rollups a forecast reads: its history window and the year to date
+    def forecast_window(self, as_of):
+        start = as_of - timedelta(days=self.forecaster.history_days)
+        start = min((start.year, start.month), (as_of.year, 1))
+        return (start[1], start[0]), (as_of.month, as_of.year)
+    
     
     # ------------ BLURBS ------------
     def generate_cumulative_blurb(self, total_spend, days_in_month):
         return f"You spent ${self.round_money(total_spend)} this month, for an average daily spend of ${self.round_money(total_spend / days_in_month)}."
     
-    def generate_spend_blurb(self, data, num_top=3):
-        top_categories = data.sort_values(by='Amount', ascending=False).head(num_top)
-        res = []
-        for _, row in top_categories.iterrows():
-            res.append(f'{row["Category"]} (${self.round_money(row["Amount"])})')
+    # top categories by spend, largest first
+    def generate_spend_blurb(self, top_categories):
+        res = [f"{category} (${self.round_money(amount)})" for category, amount in top_categories.items()]
+        if not res:
+            return "You had no spend this month."
         
         return f"Your top spend categories were: {', '.join(res[:-1])}, and {res[-1]}."
     
-    def generate_per_category_blurb(self, merged_df):
-        over, under = [], []
-        income_pattern = r"(income|salary|invest)"
-        for _, row in merged_df.iterrows():
-            diff = self.round_money(row["Amount_target"] - row["Amount_actual"])
-            category = row["Category"]
-            if re.search(income_pattern, category, re.IGNORECASE):
-                diff *= -1
-            
-            category_item = (abs(diff), category)
-            if diff >= 0:
-                over.append(category_item)
-            else:
-                under.append(category_item)
-        
-        over_items = list(map(lambda x: f"{x[1]} (${x[0]})", sorted(over, reverse=True)))
-        under_items = list(map(lambda x: f"{x[1]} (-${x[0]})", sorted(under, reverse=True)))
+    def generate_per_category_blurb(self, comparison):
+        # largest differences first, ties by category name descending
+        ranked = comparison.assign(Abs=comparison["Diff"].abs()).sort_values(["Abs", "Category"], ascending=False)
+        on_target = ranked["Diff"] >= 0
+        over_items = [f"{category} (${amount})" for category, amount in zip(ranked["Category"][on_target], ranked["Abs"][on_target])]
+        under_items = [f"{category} (-${amount})" for category, amount in zip(ranked["Category"][~on_target], ranked["Abs"][~on_target])]
         
         over_str = under_str = ""
-        if len(over) > 0:
+        if len(over_items) > 0:
             over_str = f"You were on target in the following categories: {', '.join(over_items[:-1])}, and {over_items[-1]}."
 
-        if len(under) > 0:
+        if len(under_items) > 0:
             under_str = f"You were off target in the following categories: {', '.join(under_items[:-1])}, and {under_items[-1]}."
             
         return over_str, under_str
@@ -102,86 +221,101 @@ class Reporter:
             You {under_over_spend} by ${abs(self.round_money(spend_diff))},\
             and you made ${abs(self.round_money(income_diff))} {under_over_income} than expected."
     
+    def generate_trend_blurb(self, year, monthly_spend, top_categories):
+        months = len(monthly_spend)
+        total = monthly_spend.sum()
+        top = [f"{category} (${self.round_money(amount)})" for category, amount in top_categories.items()]
+        top_str = f" Your top spend categories were: {', '.join(top)}." if top else ""
+        return f"You spent ${self.round_money(total)} across {months} months of {year}, an average of ${self.round_money(total / months)} per month.{top_str}"
+    
+    def generate_adherence_blurb(self, adherence):
+        within = int((adherence["Actual"] <= adherence["Target"]).sum())
+        return f"You stayed within your spend target in {within} of {len(adherence)} months."
+    
+    def generate_forecast_blurb(self, forecast):
+        def at_risk(df):
+            risky = df[df["Target"].notna() & (df["Overrun"] >= 0.05)].sort_values("Overrun", ascending=False)
+            items = [f'{row.Category} ({round(row.Overrun * 100)}%)' for row in risky.itertuples()]
+            return f" Chance of going over budget: {', '.join(items)}." if items else " You are unlikely to go over budget in any category."
+        
+        month_str = ""
+        if forecast["dates"]:
+            low, mid, high = map(self.round_money, forecast["month_total"])
+            month_str = f"At your usual pace you will spend about ${mid} by the end of the month (likely between ${low} and ${high}).{at_risk(forecast['month'])}"
+        
+        low, mid, high = map(self.round_money, forecast["year_total"])
+        year_str = f"As of {forecast['as_of'].strftime('%b %d')}, you are on track to spend about ${mid} this year (likely between ${low} and ${high}).{at_risk(forecast['year'])}"
+        return month_str, year_str
+    
     # ------------ FIGURES ------------
-    # create a piechart with the given data and title
-    def create_spend_piechart(self, data, title):
+    # create a piechart of per-category totals with the given title
+    def create_spend_piechart(self, totals, title):
+        data = totals.rename_axis("Category").reset_index(name="Amount")
         fig = px.pie(data, values="Amount", names="Category", title=title, color="Category", color_discrete_map=self.category_colors)
-        return pio.to_html(fig, full_html=False, include_plotlyjs="cdn"), self.generate_spend_blurb(data)
-    
-    
-    # create linechart of cumulative spend per day for this month
-    def create_cumulative_linechart(self, spend_data, title):
-        data = spend_data.copy()
-        data["Date"] = pd.to_datetime(data["Date"], format="%d %m %Y")
-        data.sort_values("Date", inplace=True)
-        data["Cumulative Spend"] = data["Amount"].cumsum()
-        
-        total_spend = data["Cumulative Spend"].iloc[-1]
-        year = data["Date"].iloc[0].year
-        month = data["Date"].iloc[0].month
-        days_in_month = monthrange(year, month)[1]
-        
-        # insert into front and end to make actual spend look better
-        front_padding = pd.DataFrame([{
-            "Date": datetime(year, month, 1),
-            "Description": "front_padding", 
-            "Category": "n/a",
-            "Amount": 0, 
-            "Cumulative Spend": 0
-        }])
-        end_padding = pd.DataFrame([{
-            "Date": datetime(year, month, days_in_month),
-            "Description": "end_padding", 
-            "Category": "n/a",
-            "Amount": 0,
-            "Cumulative Spend": total_spend
-        }])
-        data = pd.concat([front_padding, data, end_padding], ignore_index=True)
+        return self.figure_html(fig), self.generate_spend_blurb(totals.nlargest(3))
+    
+    
+    # create linechart of cumulative spend per day for this month, with forecast bands to month end if given
+    def create_cumulative_linechart(self, model, title, forecast=None):
+        year, month, days_in_month = model.year, model.month.value[0], model.days_in_month
+        total_spend = model.total_spend
+        
+        # start at zero on the 1st and hold the total to month end, to make actual spend look better.
+        # while the month is still running, actual spend stops at the forecast date and the bands take over
+        forecasting = forecast is not None and len(forecast["dates"]) > 0
+        last_day = forecast["as_of"].day if forecasting else days_in_month
+        x = [datetime(year, month, 1)] + list(model.cumulative.index) + [datetime(year, month, last_day)]
+        y = [0] + list(model.cumulative.values) + [total_spend]
         
         fig = go.Figure()
         fig.update_layout(title=title, xaxis_title="Time", yaxis_title="Amount")
         
-        fig.add_trace(go.Scatter(x=[data["Date"].iloc[0].replace(day=1), data["Date"].iloc[0].replace(day=days_in_month)], 
+        fig.add_trace(go.Scatter(x=[datetime(year, month, 1), datetime(year, month, days_in_month)], 
                              y=[0, total_spend],
                              mode="lines",
                              line={"dash": "dash", "color": "#37c2ca"},
                              name="Average Spend"))
-        fig.add_trace(go.Scatter(x=data["Date"], y=data["Cumulative Spend"], mode="lines", name="Actual Spend", line={"color": "#db534c"}))
+        fig.add_trace(go.Scatter(x=x, y=y, mode="lines", name="Actual Spend", line={"color": "#db534c"}))
         
-        return pio.to_html(fig, full_html=False, include_plotlyjs="cdn"), self.generate_cumulative_blurb(total_spend, days_in_month)
+        if forecasting:
+            x = [forecast["as_of"]] + forecast["dates"]
+            low, mid, high = ([total_spend] + list(quantile) for quantile in forecast["band"])
+            fig.add_trace(go.Scatter(x=x, y=high, mode="lines", line={"width": 0}, showlegend=False, hoverinfo="skip"))
+            fig.add_trace(go.Scatter(x=x, y=low, mode="lines", line={"width": 0}, fill="tonexty", fillcolor="rgba(219, 83, 76, 0.2)", name="Forecast (80% range)"))
+            fig.add_trace(go.Scatter(x=x, y=mid, mode="lines", line={"dash": "dot", "color": "#db534c"}, name="Forecast"))
+        
+        return self.figure_html(fig), self.generate_cumulative_blurb(total_spend, days_in_month)
     
     
-    def create_per_category_barchart(self, month, year, target, actual):
-        merged_df = target.merge(actual, on="Category", how="outer", suffixes=("_target", "_actual"))
-        merged_df.fillna(0, inplace=True)
-        
+    def create_per_category_barchart(self, model):
+        comparison = model.comparison
         categories_fig = go.Figure(data=[
-            go.Bar(name="target", x=merged_df["Category"], y=merged_df["Amount_target"], marker={"color": "#37c2ca"}),
-            go.Bar(name="actual", x=merged_df["Category"], y=merged_df["Amount_actual"], marker={"color": "#db534c"})
+            go.Bar(name="target", x=comparison["Category"], y=comparison["Target"], marker={"color": "#37c2ca"}),
+            go.Bar(name="actual", x=comparison["Category"], y=comparison["Actual"], marker={"color": "#db534c"})
         ])
-        categories_fig.update_layout(barmode="group", title=f"Target vs. Actual Spend for {month.value[1]} {year}", xaxis_title="Category", yaxis_title="Amount")
-        chart_html = pio.to_html(categories_fig, full_html=False, include_plotlyjs="cdn")
-        return chart_html, self.generate_per_category_blurb(merged_df)
+        categories_fig.update_layout(barmode="group", title=f"Target vs. Actual Spend for {model.month.value[1]} {model.year}", xaxis_title="Category", yaxis_title="Amount")
+        chart_html = self.figure_html(categories_fig)
+        return chart_html, self.generate_per_category_blurb(comparison)
     
     
-    def create_totals_barchart(self, month, year, target_income, target_spend, actual_income, actual_spend):
-        tot_target_income, tot_target_spend = target_income["Amount"].sum(), target_spend["Amount"].sum()
-        tot_actual_income, tot_actual_spend = actual_income["Amount"].sum(), actual_spend["Amount"].sum()
+    def create_totals_barchart(self, model):
+        tot_target_income, tot_target_spend = model.total_target_income, model.total_target_spend
+        tot_actual_income, tot_actual_spend = model.total_actual_income, model.total_actual_spend
         totals_fig = go.Figure(data=[
             go.Bar(name="target", x=["Income", "Spend"], y=[tot_target_income, tot_target_spend], marker={"color": "#37c2ca"}),
             go.Bar(name="actual", x=["Income", "Spend"], y=[tot_actual_income, tot_actual_spend], marker={"color": "#db534c"})
         ])
-        totals_fig.update_layout(barmode="group", title=f"Net Difference for {month.value[1]} {year}", xaxis_title="Category", yaxis_title="Amount")
-        chart_html = pio.to_html(totals_fig, full_html=False, include_plotlyjs="cdn")
+        totals_fig.update_layout(barmode="group", title=f"Net Difference for {model.month.value[1]} {model.year}", xaxis_title="Category", yaxis_title="Amount")
+        chart_html = self.figure_html(totals_fig)
         return chart_html, self.generate_totals_blurb(tot_target_income, tot_target_spend, tot_actual_income, tot_actual_spend)
     
     
-    def generate_sankeymatic_chart(self, actual_income, actual_spend):
+    def generate_sankeymatic_chart(self, model):
         chart_contents = []
         colors = [":Income #4c956c", ":Spending #7a71f8"]
         
-        total_income = self.round_money(actual_income["Amount"].sum())
-        total_spend = self.round_money(actual_spend["Amount"].sum())
+        total_income = self.round_money(model.total_actual_income)
+        total_spend = self.round_money(model.total_actual_spend)
         savings = total_income - total_spend
         
         # append savings or overdraft
@@ -195,8 +329,7 @@ class Reporter:
             colors.append(":Bank #79021c")
         
         # append spend by category
-        for _, row in actual_spend.iterrows():
-            category, amount = row["Category"], self.round_money(row["Amount"])
+        for category, amount in model.actual_spend.round(2).items():
             chart_contents.append(f"Spending [{amount}] {category}")
             
             if category in self.category_colors:
@@ -205,25 +338,293 @@ class Reporter:
         return "<br>\n".join(chart_contents + colors)
         
     
+    # ------------ FORECAST ------------
+    # simulate the rest of the month and year from the trailing year of daily spend in the rollups
+    def create_forecast(self, month, year, month_target):
+        as_of = self.forecast_as_of(month, year)
+        if as_of is None:
+            return None
+        
+        rollups = self.get_rollups().read_range(*self.forecast_window(as_of))
+        if rollups.empty:
+            return None
+        _, _, spend = self.split_df(rollups)
+        
+        to_date = (spend["Year"] == as_of.year) & ((spend["Month"] < as_of.month) | ((spend["Month"] == as_of.month) & (spend["Day"] <= as_of.day)))
+        year_spend = spend[to_date]
+        year_actual = year_spend.groupby("Category")["Amount"].sum()
+        month_actual = year_spend[year_spend["Month"] == as_of.month].groupby("Category")["Amount"].sum()
+        year_target = pd.concat([self.load_target(m, year)[2] for m in Month]).groupby("Category")["Amount"].sum()
+        return self.forecaster.forecast(spend, as_of, month_actual, year_actual, month_target, year_target)
+    
+    
+    # ------------ TRENDS ------------
+    # cumulative year-to-date spend per category
+    def create_ytd_category_linechart(self, spend, title):
+        by_month = spend.groupby(["Month", "Category"])["Amount"].sum().unstack(fill_value=0).sort_index().cumsum()
+        fig = go.Figure()
+        for category in by_month.columns:
+            fig.add_trace(go.Scatter(x=[Month.from_value(m).value[1] for m in by_month.index], y=by_month[category], mode="lines+markers", name=category, line={"color": self.category_colors.get(category)}))
+        fig.update_layout(title=title, xaxis_title="Month", yaxis_title="Amount")
+        return self.figure_html(fig)
+    
+    # monthly spend and income with a rolling 3-month average of spend
+    def create_rolling_linechart(self, monthly_spend, monthly_income, rolling_spend, title):
+        labels = [f"{Month.from_value(m).value[1]} {y}" for y, m in monthly_spend.index]
+        fig = go.Figure(data=[
+            go.Bar(name="spend", x=labels, y=monthly_spend.values, marker={"color": "#db534c"}),
+            go.Bar(name="income", x=labels, y=monthly_income.values, marker={"color": "#37c2ca"}),
+            go.Scatter(name="3-month average spend", x=labels, y=rolling_spend.values, mode="lines", line={"dash": "dash", "color": "#7d9394"})
+        ])
+        fig.update_layout(barmode="group", title=title, xaxis_title="Month", yaxis_title="Amount")
+        return self.figure_html(fig)
+    
+    # actual vs. target spend per month
+    def create_adherence_barchart(self, adherence, title):
+        labels = [Month.from_value(m).value[1] for m in adherence.index]
+        fig = go.Figure(data=[
+            go.Bar(name="target", x=labels, y=adherence["Target"], marker={"color": "#37c2ca"}),
+            go.Bar(name="actual", x=labels, y=adherence["Actual"], marker={"color": "#db534c"})
+        ])
+        fig.update_layout(barmode="group", title=title, xaxis_title="Month", yaxis_title="Amount")
+        return self.figure_html(fig)
+    
+    # create an annual trend report from the monthly rollups rather than the raw transactions
+    def create_trend_report(self, year):
+        # include the two prior months so the rolling average is full from January
+        rollups = self.get_rollups().read_range((11, year - 1), (12, year))
+        if rollups.empty or not (rollups["Year"] == year).any():
+            print(f"Could not find any rollups for {year}")
+            return False
+        
+        _, income, spend = self.split_df(rollups)
+        periods = pd.MultiIndex.from_frame(rollups[["Year", "Month"]].drop_duplicates().sort_values(["Year", "Month"]))
+        monthly_spend = spend.groupby(["Year", "Month"])["Amount"].sum().reindex(periods, fill_value=0)
+        monthly_income = income.groupby(["Year", "Month"])["Amount"].sum().reindex(periods, fill_value=0)
+        rolling_spend = self.rolling_average(monthly_spend)
+        
+        in_year = monthly_spend.index.get_level_values("Year") == year
+        monthly_spend, monthly_income, rolling_spend = monthly_spend[in_year], monthly_income[in_year], rolling_spend[in_year]
+        year_spend = spend[spend["Year"] == year]
+        top_categories = year_spend.groupby("Category")["Amount"].sum().sort_values(ascending=False).head(3)
+        
+        months = monthly_spend.index.get_level_values("Month")
+        adherence = pd.DataFrame({
+            "Target": [self.load_target(Month.from_value(m), year)[2]["Amount"].sum() for m in months],
+            "Actual": monthly_spend.values
+        }, index=months)
+        
+        self.pending_figures = []
+        if self.offline:
+            self.write_plotlyjs()
+        ytd_html = self.create_ytd_category_linechart(year_spend, f"Year-to-Date Spend by Category for {year}")
+        rolling_html = self.create_rolling_linechart(monthly_spend, monthly_income, rolling_spend, f"Monthly Spend and Income for {year}")
+        adherence_html = self.create_adherence_barchart(adherence, f"Target vs. Actual Spend by Month for {year}")
+        plotlyjs_script, figures_script = self.figure_scripts()
+        
+        report = f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>{year} Trends</title>
+            {plotlyjs_script}
+            <style>
+                .chart-container {{
+                    margin-bottom: 50px;
+                    margin: auto;
+                    width: 66%;
+                    font-family: verdana, georgia;
+                }}
+            </style>
+        </head>
+        <body>
+            <div class="chart-container">
+                <h2>Year-to-Date Spend</h2>
+                {ytd_html}
+                <p>{self.generate_trend_blurb(year, monthly_spend, top_categories)}</p>
+            </div>
+            <div class="chart-container">
+                <h2>Monthly Trend</h2>
+                {rolling_html}
+            </div>
+            <div class="chart-container">
+                <h2>Budget Adherence</h2>
+                {adherence_html}
+                <p>{self.generate_adherence_blurb(adherence)}</p>
+            </div>
+            {figures_script}
+        </body>
+        </html>
+        """
+        
+        self.write_report(f"reports/trends_{year}.html", report)
+        return True
+    
+    
     # ------------ MAIN ------------
     def run(self, month, year=None):
         if not year:
             year = datetime.now().date().year
         self.create_report(month, year)
     
-    # create report with data visualizations for target vs. actual spend
+    # create reports for many (month, year) periods, sharing settings and loaded data across them
+    def run_many(self, periods, workers=None):
+        periods = [(month if isinstance(month, Month) else Month.from_value(month), year or datetime.now().date().year) for month, year in periods]
+        
+        # drop months whose inputs have not changed since their report was built
+        inputs = {}
+        stale = []
+        for month, year in periods:
+            inputs[(month, year)] = self.report_inputs(month, year)
+            if self.is_up_to_date(month, year, inputs[(month, year)]):
+                print(f"Skipping {month.value[2]}, {year}: report is up to date")
+            else:
+                stale.append((month, year))
+        periods = stale
+        if not periods:
+            return []
+        
+        actual_raw = self.load_actual_range(periods)
+        if actual_raw.empty:
+            print("Could not find any actual data for the requested months")
+            return []
+        
+        # categories are mapped and summed once for the whole range, then sliced per month for each model
+        actual = self.map_categories(actual_raw)
+        totals = actual.groupby(["Year", "Month", "Category"])["Amount"].sum()
+        month_totals = {(int(year), int(month)): part.droplevel(["Year", "Month"]) for (year, month), part in totals.groupby(level=["Year", "Month"], sort=False)}
+        actual_parts = self.partition(actual)
+        tasks = []
+        for month, year in periods:
+            key = (year, month.value[0])
+            if key not in actual_parts:
+                print(f"Skipping {month.value[2]}, {year}: no actual data")
+                continue
+            tasks.append((month, year, actual_parts[key], month_totals[key]))
+        
+        if len(tasks) <= 1 or workers == 1:
+            for task in tasks:
+                self.render_report(*task)
+        else:
+            # workers read the same ledger, and the rollups report_inputs has already refreshed
+            ledger_path = self.ledger.filepath if self.ledger else None
+            rollups_path = self.rollups.filepath if self.rollups_refreshed else None
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_render_worker, initargs=(self.offline, ledger_path, rollups_path)) as executor:
+                list(executor.map(render_worker, tasks))
+        
+        rendered = [(month, year) for month, year, *_ in tasks]
+        for month, year in rendered:
+            self.manifest.record(self.report_key(month, year), inputs[(month, year)])
+        self.manifest.save()
+        return rendered
+    
+    def report_key(self, month, year):
+        return f"{month.value[0]}_{year}"
+    
+    # content hashes of everything a month's report is built from
+    def report_inputs(self, month, year):
+        goals = f"goals/{month.value[0]}_{year}.csv"
+        if self.ledger and self.ledger.has(month.value[0], year):
+            actual_hash = self.ledger.partition_hash(month.value[0], year)
+        else:
+            actual_hash = BuildManifest.hash_file(f"actual/{month.value[0]}_{year}.csv")
+        
+        inputs = {
+            "actual": actual_hash,
+            "Mappings": self.settings_hashes.get("Mappings"),
+            "Colors": self.settings_hashes.get("Colors"),
+            "plotlyjs": self.plotlyjs_filename() if self.offline else "cdn",
+        }
+        # forecasts read the trailing rollups, and the current month's moves with today's date. their year
+        # target sums every month's goals, or the settings budget for months without a goals file
+        as_of = self.forecast_as_of(month, year)
+        if as_of:
+            inputs["forecast"] = f"{as_of}:{self.get_rollups().range_hash(*self.forecast_window(as_of))}"
+            inputs["year_target"] = [BuildManifest.hash_file(f"goals/{m.value[0]}_{year}.csv") or self.settings_hashes.get("Budget") for m in Month]
+        # the settings budget only matters for months without their own goals file
+        if exists(goals):
+            inputs["goals"] = BuildManifest.hash_file(goals)
+        else:
+            inputs["Budget"] = self.settings_hashes.get("Budget")
+        return inputs
+    
+    def is_up_to_date(self, month, year, inputs):
+        return not self.force and self.manifest.is_fresh(self.report_key(month, year), f"reports/{month.value[0]}_{year}.html", inputs)
+    
+    # split a frame with Year/Month columns into {(year, month): frame without them}
+    def partition(self, df):
+        return {(int(year), int(month)): part.drop(columns=["Year", "Month"]).reset_index(drop=True) for (year, month), part in df.groupby(["Year", "Month"], sort=False)}
+    
+    # load actuals for every requested month into one frame tagged with Year and Month
+    def load_actual_range(self, periods):
+        columns = ["Year", "Month", "Date", "Category", "Amount"]
+        if self.ledger:
+            stored = set(self.ledger.periods())
+            in_ledger = [(month.value[0], year) for month, year in periods if (month.value[0], year) in stored]
+            frames = [self.ledger.read_months(in_ledger, columns=("Date", "Category", "Amount"), with_period=True)]
+            periods = [(month, year) for month, year in periods if (month.value[0], year) not in stored]
+        else:
+            frames = []
+        
+        for month, year in periods:
+            filepath = f"actual/{month.value[0]}_{year}.csv"
+            if exists(filepath):
+                df = pd.read_csv(filepath, usecols=["Date", "Category", "Amount"])
+                df.insert(0, "Month", month.value[0])
+                df.insert(0, "Year", year)
+                frames.append(df)
+        
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        # parse dates once for the whole range rather than once per month's chart
+        df = pd.concat(frames, ignore_index=True)[columns]
+        df["Date"] = pd.to_datetime(df["Date"], format="%d %m %Y")
+        return df
+    
+    # load a month's goals, falling back to the settings.json budget (loaded once)
+    def load_target(self, month, year):
+        goals = f"goals/{month.value[0]}_{year}.csv"
+        if exists(goals):
+            return self.split_spend_income([goals])
+        
+        if self.default_target is None:
+            self.default_target = self.split_spend_income(["settings.json"])
+        return self.default_target
+    
+    # create report with data visualizations for target vs. actual spend, unless its inputs are unchanged
     def create_report(self, month, year):
-        target, target_income, target_spend = self.split_spend_income([f"goals/{month.value[0]}_{year}.csv", "settings.json"])
-        actual_raw, actual_income, actual_spend_raw = self.split_spend_income([f"actual/{month.value[0]}_{year}.csv"])
-        actual_spend = actual_spend_raw.groupby("Category")["Amount"].sum().reset_index()
-        actual = actual_raw.groupby("Category")["Amount"].sum().reset_index()
-        
-        target_spend_piechart_html, target_spend_piechart_blurb = self.create_spend_piechart(target_spend, f"Target Spend for {month.value[1]} {year}")
-        actual_spend_piechart_html, actual_spend_piechart_blurb = self.create_spend_piechart(actual_spend, f"Actual Spend for {month.value[1]} {year}")
-        actual_spend_linechart_html, actual_spend_linechart_blurb = self.create_cumulative_linechart(actual_spend_raw, f"Cumulative Spend for {month.value[1]} {year}")
-        per_category_html, (over_cateory_blurb, under_category_blurb) = self.create_per_category_barchart(month, year, target, actual)
-        totals_html, totals_blurb = self.create_totals_barchart(month, year, target_income, target_spend, actual_income, actual_spend)
-        sankeymatic_chart = self.generate_sankeymatic_chart(actual_income, actual_spend)
+        inputs = self.report_inputs(month, year)
+        if self.is_up_to_date(month, year, inputs):
+            return False
+        
+        self.render_report(month, year, self.load_actual(month, year))
+        
+        self.manifest.record(self.report_key(month, year), inputs)
+        self.manifest.save()
+        return True
+    
+    # the figures' and blurbs' inputs for a month's mapped actuals and its target
+    def build_model(self, month, year, actual, actual_totals=None):
+        return ReportModel(month, year, actual, self.load_target(month, year)[0], actual_totals)
+    
+    # build a month's model from its mapped actuals (and per-category totals, if already summed),
+    # then its charts and blurbs, and write its html report
+    def render_report(self, month, year, actual, actual_totals=None):
+        model = self.build_model(month, year, actual, actual_totals)
+        self.pending_figures = []
+        if self.offline:
+            self.write_plotlyjs()
+        
+        target_spend_piechart_html, target_spend_piechart_blurb = self.create_spend_piechart(model.target_spend, f"Target Spend for {month.value[1]} {year}")
+        actual_spend_piechart_html, actual_spend_piechart_blurb = self.create_spend_piechart(model.actual_spend, f"Actual Spend for {month.value[1]} {year}")
+        forecast = self.create_forecast(month, year, model.target_spend)
+        month_forecast_blurb, year_forecast_blurb = self.generate_forecast_blurb(forecast) if forecast else ("", "")
+        actual_spend_linechart_html, actual_spend_linechart_blurb = self.create_cumulative_linechart(model, f"Cumulative Spend for {month.value[1]} {year}", forecast)
+        per_category_html, (over_cateory_blurb, under_category_blurb) = self.create_per_category_barchart(model)
+        totals_html, totals_blurb = self.create_totals_barchart(model)
+        sankeymatic_chart = self.generate_sankeymatic_chart(model)
+        plotlyjs_script, figures_script = self.figure_scripts()
         
         # create report
         report = f"""
@@ -231,6 +632,7 @@ class Reporter:
         <html>
         <head>
             <title>{month.value[1]} {year} Report</title>
+            {plotlyjs_script}
             <style>
                 .chart-container {{
                     margin-bottom: 50px;
@@ -251,6 +653,8 @@ class Reporter:
                 <h2>Cumulative Spend</h2>
                 {actual_spend_linechart_html}
                 <p>{actual_spend_linechart_blurb}</p>
+                <p>{month_forecast_blurb}</p>
+                <p>{year_forecast_blurb}</p>
             </div>
             <div class="chart-container">
                 <h2>Target Spend Breakdown</h2>
@@ -283,13 +687,32 @@ class Reporter:
                     </iframe>
                 </div>    
             </div>
-            
+            {figures_script}
         </body>
         </html>
         """
         
-        with open(f"reports/{month.value[0]}_{year}.html", "w") as out_file:
-            out_file.write(report)
+        self.write_report(f"reports/{month.value[0]}_{year}.html", report)
+    
+    # written to a temp file and renamed, so a browser or the report server never reads half a report
+    def write_report(self, filepath, report):
+        write_atomic(filepath, lambda out_file: out_file.write(report))
+
+
+# process pool helpers: each worker keeps one Reporter for all the months it renders
+_render_worker = None
+
+def init_render_worker(offline=False, ledger_path=None, rollups_path=None):
+    global _render_worker
+    ledger = None
+    if ledger_path:
+        from LedgerStore import LedgerStore
+        ledger = LedgerStore(ledger_path)
+    _render_worker = Reporter(ledger=ledger, offline=offline, rollups=RollupCache(rollups_path) if rollups_path else None)
+    _render_worker.rollups_refreshed = rollups_path is not None
+
+def render_worker(task):
+    _render_worker.render_report(*task)
         
         
 if __name__ == "__main__":
@@ -0,0 +1,146 @@
+import csv, os, re, sqlite3
+from hashlib import blake2b
+from glob import glob
+from os.path import basename
+from BuildManifest import BuildManifest
+
+
+# persistent per-day, per-category monthly aggregates, kept up to date as transactions are exported.
+# raw bank categories are stored so mappings can change without invalidating anything;
+# category totals, income/spend totals and cumulative daily spend are all derived from these rows.
+class RollupCache:
+    def __init__(self, filepath="actual/rollups.db"):
+        self.filepath = filepath
+        os.makedirs(os.path.dirname(filepath) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(filepath, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rollups (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                day INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                amount REAL NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (year, month, day, category)
+            )
+        """)
+        # what each month's rollups were computed from: its csv's "mtime:size" stat and content hash,
+        # or its ledger partition's hash with no stat
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS sources (
+                year INTEGER NOT NULL,
+                month INTEGER NOT NULL,
+                stat TEXT,
+                hash TEXT,
+                PRIMARY KEY (year, month)
+            )
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    # drop and recompute a month from its full set of (date, description, category, amount, ...) rows, in one
+    # commit with the (stat, hash) of the csv or ledger partition they were read from.
+    # undated rows (salary and other manual income) are kept under day 0
+    def replace(self, month, year, rows, source=(None, None)):
+        totals = {}
+        for date, _, category, amt, *_ in rows:
+            day = int(str(date).split()[0]) if date not in (None, "") else 0
+            amount, count = totals.get((day, category), (0.0, 0))
+            totals[(day, category)] = (amount + float(amt), count + 1)
+
+        with self.conn:
+            self.conn.execute("DELETE FROM rollups WHERE year = ? AND month = ?", (year, month))
+            self.conn.executemany(
+                "INSERT INTO rollups (year, month, day, category, amount, count) VALUES (?, ?, ?, ?, ?, ?)",
+                [(year, month, day, category, amount, count) for (day, category), (amount, count) in totals.items()]
+            )
+            self.conn.execute("INSERT OR REPLACE INTO sources (year, month, stat, hash) VALUES (?, ?, ?, ?)", (year, month, *source))
+
+    # rollup rows for every month between (start_month, start_year) and (end_month, end_year), inclusive
+    def read_range(self, start, end):
+        import pandas as pd
+        (start_month, start_year), (end_month, end_year) = start, end
+        return pd.read_sql_query(
+            """SELECT year AS "Year", month AS "Month", day AS "Day", category AS "Category", amount AS "Amount", count AS "Count"
+               FROM rollups WHERE year * 12 + month BETWEEN ? AND ? ORDER BY year, month, day""",
+            self.conn, params=(start_year * 12 + start_month, end_year * 12 + end_month)
+        )
+
+    # content hash of the rollup rows for a range of months, for change detection
+    def range_hash(self, start, end):
+        (start_month, start_year), (end_month, end_year) = start, end
+        h = blake2b(digest_size=16)
+        rows = self.conn.execute(
+            "SELECT year, month, day, category, amount, count FROM rollups WHERE year * 12 + month BETWEEN ? AND ? ORDER BY year, month, day, category",
+            (start_year * 12 + start_month, end_year * 12 + end_month)
+        )
+        for row in rows:
+            h.update(repr(row).encode())
+        return h.hexdigest()
+
+    # (month, year) months that hold any rollups
+    def periods(self):
+        return [(month, year) for month, year in self.conn.execute("SELECT DISTINCT month, year FROM rollups ORDER BY year, month")]
+
+    # recompute every month from the csvs in actual/ (or from a LedgerStore)
+    def rebuild(self, csv_dir="actual", ledger=None):
+        return self.rebuild_months(self.source_months(csv_dir, ledger), ledger)
+
+    # recompute the months whose csv or ledger partition no longer matches what their rollups were computed
+    # from: months imported before rollups were kept, and those whose importer stopped between writing the
+    # month and updating its rollups. a csv is only hashed when its stat has changed
+    def refresh(self, csv_dir="actual", ledger=None):
+        recorded = {(month, year): (stat, source_hash) for year, month, stat, source_hash in self.conn.execute("SELECT year, month, stat, hash FROM sources")}
+        stale = {}
+        for (month, year), filepath in self.source_months(csv_dir, ledger).items():
+            stat, source_hash = recorded.get((month, year), (None, None))
+            if ledger:
+                if ledger.partition_hash(month, year) != source_hash:
+                    stale[(month, year)] = filepath
+                continue
+            if BuildManifest.stat_file(filepath) == stat:
+                continue
+            if source_hash is not None and BuildManifest.hash_file(filepath) == source_hash:
+                # touched but unchanged
+                with self.conn:
+                    self.conn.execute("UPDATE sources SET stat = ? WHERE year = ? AND month = ?", (BuildManifest.stat_file(filepath), year, month))
+                continue
+            stale[(month, year)] = filepath
+        return self.rebuild_months(stale, ledger)
+
+    # {(month, year): csv filepath, or None for ledger partitions} of every month with transactions
+    def source_months(self, csv_dir="actual", ledger=None):
+        if ledger:
+            return {period: None for period in ledger.periods()}
+        months = {}
+        for filepath in sorted(glob(f"{csv_dir}/*.csv")):
+            match = re.fullmatch(r"(\d{1,2})_(\d{4})\.csv", basename(filepath))
+            if match:
+                months[(int(match.group(1)), int(match.group(2)))] = filepath
+        return months
+
+    # the source is read before the rows, so a write landing in between leaves it stale for the next refresh
+    def rebuild_months(self, months, ledger=None):
+        for (month, year), filepath in months.items():
+            if ledger:
+                source = (None, ledger.partition_hash(month, year))
+                rows = ledger.rows(month, year)
+            else:
+                source = csv_source(filepath)
+                with open(filepath, "r") as in_file:
+                    rows = [(row["Date"], row["Description"], row["Category"], row["Amount"]) for row in csv.DictReader(in_file)]
+            self.replace(month, year, rows, source)
+        return list(months)
+
+
+# (stat, hash) of a month csv, as recorded with its rollups
+def csv_source(filepath):
+    return BuildManifest.stat_file(filepath), BuildManifest.hash_file(filepath)
+
+
+if __name__ == "__main__":
+    rollups = RollupCache()
+    periods = rollups.rebuild()
+    print(f"Rebuilt rollups for {len(periods)} months in {rollups.filepath}")
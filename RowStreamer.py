@@ -0,0 +1,104 @@
+from html.parser import HTMLParser
+from html import unescape
+
+# elements that never get a closing tag, so they don't change nesting depth
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+
+
+# incrementally walk an html file and yield each row as {field: text}, one at a time, read straight off
+# the parser events with field_names(tag, classes, id). only the row currently being read is held in memory,
+# so large exports stay flat
+class RowStreamer(HTMLParser):
+    def __init__(self, is_container, is_row, field_names, chunk_size=64 * 1024):
+        super().__init__(convert_charrefs=False)
+        self.is_container = is_container
+        self.is_row = is_row
+        self.chunk_size = chunk_size
+        self.field_names = field_names
+
+        self.container_depth = None
+        self.depth = 0
+        self.row_depth = None
+        self.rows = []
+        # text parts of each field in the current row, and the (field, depth) of the elements still open
+        self.fields = {}
+        self.open_fields = []
+
+
+    # yield the fields of every row in the file
+    def stream(self, filepath):
+        with open(filepath, "r") as in_file:
+            while chunk := in_file.read(self.chunk_size):
+                self.feed(chunk)
+                yield from self.drain()
+            self.close()
+            yield from self.drain()
+
+    def drain(self):
+        rows, self.rows = self.rows, []
+        return rows
+
+    def in_row(self):
+        return self.row_depth is not None
+
+    def add_text(self, text):
+        for name, _ in self.open_fields:
+            self.fields[name].append(text)
+
+    def open_row(self, tag, attrs):
+        self.row_depth = self.depth
+        self.fields = {}
+        self.open_fields = []
+        self.open_field(tag, attrs)
+
+    def open_field(self, tag, attrs):
+        if tag in VOID_TAGS:
+            return
+        for name in self.field_names(tag, (attrs.get("class") or "").split(), attrs.get("id")):
+            if name not in self.fields:
+                self.fields[name] = []
+                self.open_fields.append((name, self.depth))
+
+    def close_row(self):
+        self.rows.append({name: "".join(parts).strip() for name, parts in self.fields.items()})
+        self.row_depth = None
+
+
+    # ------------ PARSER CALLBACKS ------------
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if self.in_row():
+            self.open_field(tag, attrs)
+        elif self.container_depth is None:
+            if self.is_container(tag, attrs):
+                self.container_depth = self.depth
+        elif self.is_row(tag, attrs, self.depth - self.container_depth):
+            self.open_row(tag, attrs)
+
+        if tag not in VOID_TAGS:
+            self.depth += 1
+
+    def handle_endtag(self, tag):
+        if tag in VOID_TAGS:
+            return
+
+        self.depth -= 1
+        if self.in_row():
+            while self.open_fields and self.open_fields[-1][1] >= self.depth:
+                self.open_fields.pop()
+            if self.depth == self.row_depth:
+                self.close_row()
+        elif self.container_depth is not None and self.depth <= self.container_depth:
+            self.container_depth = None
+
+    def handle_data(self, data):
+        if self.in_row():
+            self.add_text(data)
+
+    def handle_entityref(self, name):
+        if self.in_row():
+            self.add_text(unescape(f"&{name};"))
+
+    def handle_charref(self, name):
+        if self.in_row():
+            self.add_text(unescape(f"&#{name};"))
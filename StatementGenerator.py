@@ -0,0 +1,128 @@
+import argparse, csv, random
+from calendar import monthrange
+from datetime import date
+from html import escape
+from classes import TransactionSource, Month
+
+# (merchant, Capital One category, Discover category, typical amount)
+MERCHANTS = [
+    ("CHIPOTLE 1234", "Dining", "Restaurants", 14),
+    ("STARBUCKS STORE 5521", "Dining", "Restaurants", 6),
+    ("SWEETGREEN BOSTON", "Dining", "Restaurants", 16),
+    ("TRADER JOE S #512", "Grocery", "Supermarkets", 65),
+    ("WHOLE FOODS MARKET", "Grocery", "Supermarkets", 90),
+    ("COSTCO WHSE #0301", "Grocery", "Wholesale Clubs", 140),
+    ("SHELL OIL 57442", "Gas/Automotive", "Gasoline", 45),
+    ("JIFFY LUBE #1123", "Gas/Automotive", "Automotive", 80),
+    ("AMAZON.COM*2K4LP", "Merchandise", "Department Stores", 35),
+    ("TARGET 00012345", "Merchandise", "Department Stores", 50),
+    ("HOME DEPOT #2602", "Other", "Home Improvement", 70),
+    ("CVS/PHARMACY #1029", "Other", "Medical Services", 20),
+    ("AMC THEATRES 2211", "Entertainment", "Travel/ Entertainment", 30),
+    ("SPOTIFY USA", "Entertainment", "Services", 11),
+    ("DELTA AIR LINES", "Other Travel", "Travel/ Entertainment", 320),
+    ("UBER   *TRIP", "Other Travel", "Travel/ Entertainment", 22),
+]
+
+
+# emits synthetic but realistically shaped bank statement html, streamed to disk so any size fits in memory
+class StatementGenerator:
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+
+    # random (date, merchant, amount) rows spread over the months of a year; a few are payments/credits
+    def transactions(self, count, year):
+        for _ in range(count):
+            month = self.random.randint(1, 12)
+            day = self.random.randint(1, monthrange(year, month)[1])
+            merchant = self.random.choice(MERCHANTS)
+            amount = round(self.random.lognormvariate(0, 0.6) * merchant[3], 2)
+            if self.random.random() < 0.02:
+                amount = -amount
+            yield date(year, month, day), merchant, amount
+
+    def format_amount(self, amount):
+        sign = "-" if amount < 0 else ""
+        return f"{sign}${abs(amount):,.2f}"
+
+    # Capital One: rows under c1-ease-table__body, with a handful still pending (no posted date)
+    def write_c1(self, filepath, count, year):
+        with open(filepath, "w") as out_file:
+            out_file.write('<html><head><title>Capital One</title></head><body>\n<div class="c1-ease-table">\n<div class="c1-ease-table__body">\n')
+            for i, (txn_date, (desc, category, _, _), amount) in enumerate(self.transactions(count, year)):
+                pending = self.random.random() < 0.01
+                date_html = "" if pending else (
+                    f'<span class="c1-ease-txns-date-and-status__month">{Month.from_value(txn_date.month).value[1]}</span>'
+                    f'<span class="c1-ease-txns-date-and-status__day">{txn_date.day}</span>'
+                )
+                out_file.write(
+                    f'<div class="c1-ease-row" id="row-{i}">'
+                    f'<c1-ease-cell class="c1-ease-card-transactions-view-table__date"><div class="c1-ease-txns-date-and-status">{date_html}</div></c1-ease-cell>'
+                    f'<c1-ease-cell class="c1-ease-card-transactions-view-table__description"><div class="c1-ease-txns-description__description">{escape(desc)}</div></c1-ease-cell>'
+                    f'<c1-ease-cell class="c1-ease-card-transactions-view-table__category"><span class="c1-ease-card-transactions-view-table__rewards-category">{escape(category)}</span></c1-ease-cell>'
+                    f'<c1-ease-cell class="c1-ease-card-transactions-view-table__amount"><span>{self.format_amount(amount)}</span></c1-ease-cell>'
+                    '</div>\n'
+                )
+            out_file.write("</div>\n</div>\n</body></html>\n")
+
+    # Discover: rows of transactions-table, dated mm/dd/yy
+    def write_disc(self, filepath, count, year):
+        with open(filepath, "w") as out_file:
+            out_file.write('<html><head><title>Discover</title></head><body>\n<table id="transactions-table">\n')
+            out_file.write('<thead><tr><th>Trans. date</th><th>Description</th><th>Category</th><th>Amount</th></tr></thead>\n<tbody>\n')
+            for i, (txn_date, (desc, _, category, _), amount) in enumerate(self.transactions(count, year)):
+                out_file.write(
+                    f'<tr id="transaction-{i}" class="transaction-row">'
+                    f'<td class="trans-date">{txn_date.strftime("%m/%d/%y")}</td>'
+                    f'<td class="desc"><a class="transaction-detail-toggler" href="#">{escape(desc)}</a></td>'
+                    f'<td class="ctg">{escape(category)}</td>'
+                    f'<td class="amt">{"-" if amount < 0 else ""}${abs(amount):.2f}</td>'
+                    '</tr>\n'
+                )
+            out_file.write("</tbody>\n</table>\n</body></html>\n")
+
+    # SoFi: csv download, oldest first, with debits negative
+    def write_sofi(self, filepath, count, year):
+        with open(filepath, "w", newline="") as out_file:
+            writer = csv.writer(out_file)
+            writer.writerow(["Date", "Description", "Type", "Amount", "Current balance", "Status"])
+            balance = 10000.0
+            for txn_date, (desc, _, _, _), amount in sorted(self.transactions(count, year), key=lambda t: t[0]):
+                balance -= amount
+                writer.writerow([txn_date.isoformat(), desc, "Debit Card" if amount > 0 else "Deposit", f"{-amount:.2f}", f"{balance:.2f}", "Posted"])
+
+    # Bank of America: OFX 1.x (SGML) download with unclosed leaf tags and debits negative
+    def write_bofa(self, filepath, count, year):
+        with open(filepath, "w") as out_file:
+            out_file.write("OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n<OFX>\n<BANKMSGSRSV1>\n<STMTTRNRS>\n<STMTRS>\n<CURDEF>USD\n<BANKTRANLIST>\n")
+            for i, (txn_date, (desc, _, _, _), amount) in enumerate(self.transactions(count, year)):
+                out_file.write(
+                    f"<STMTTRN>\n<TRNTYPE>{'DEBIT' if amount > 0 else 'CREDIT'}\n<DTPOSTED>{txn_date.strftime('%Y%m%d')}120000.000[-5:EST]\n"
+                    f"<TRNAMT>{-amount:.2f}\n<FITID>{year}{i:08d}\n<NAME>{escape(desc)}\n</STMTTRN>\n"
+                )
+            out_file.write("</BANKTRANLIST>\n</STMTRS>\n</STMTTRNRS>\n</BANKMSGSRSV1>\n</OFX>\n")
+
+    def write(self, source, filepath, count, year):
+        match source:
+            case TransactionSource.C1:
+                self.write_c1(filepath, count, year)
+            case TransactionSource.DISC:
+                self.write_disc(filepath, count, year)
+            case TransactionSource.SOFI:
+                self.write_sofi(filepath, count, year)
+            case TransactionSource.BOFA:
+                self.write_bofa(filepath, count, year)
+            case _:
+                raise NotImplementedError(f"No statement generator for {source.value[2]}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic bank statements")
+    parser.add_argument('-b', '--bank', required=True, help='Bank to generate a statement for')
+    parser.add_argument('-f', '--filepath', required=True, help='Output filepath')
+    parser.add_argument('-n', '--count', type=int, default=1000, help='Number of transactions')
+    parser.add_argument('-y', '--year', type=int, default=date.today().year, help='Year of the transactions')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    StatementGenerator(args.seed).write(TransactionSource.from_value(args.bank), args.filepath, args.count, args.year)
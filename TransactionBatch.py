@@ -0,0 +1,84 @@
+from array import array
+from datetime import date
+from classes import TransactionSource
+
+SOURCES = list(TransactionSource)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+# column-oriented transactions: dates as days since 1970-01-01, amounts as integer cents,
+# and categories and sources as small codes into shared tables instead of one object per row
+class TransactionBatch:
+    def __init__(self):
+        self.days = array("q")
+        self.cents = array("q")
+        self.descs = []
+        self.category_codes = array("i")
+        self.source_codes = array("b")
+        self.categories = []
+        self.category_index = {}
+
+    def __len__(self):
+        return len(self.days)
+
+    def category_code(self, category):
+        code = self.category_index.get(category)
+        if code is None:
+            code = self.category_index[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def append(self, txn_date, desc, category, amt, source=None):
+        self.days.append(txn_date.toordinal() - EPOCH_ORDINAL)
+        self.cents.append(round(amt * 100))
+        self.descs.append(desc)
+        self.category_codes.append(self.category_code(category))
+        self.source_codes.append(SOURCES.index(source) if source else -1)
+
+    # append the rows of another batch, or only those at the given indices
+    def extend(self, other, indices=None):
+        if indices is None:
+            indices = range(len(other))
+        codes = [self.category_code(category) for category in other.categories]
+        self.days.extend(other.days[i] for i in indices)
+        self.cents.extend(other.cents[i] for i in indices)
+        self.descs.extend(other.descs[i] for i in indices)
+        self.category_codes.extend(codes[other.category_codes[i]] for i in indices)
+        self.source_codes.extend(other.source_codes[i] for i in indices)
+
+    # a new batch with the rows at the given indices, in that order
+    def take(self, indices):
+        batch = TransactionBatch()
+        batch.extend(self, indices)
+        return batch
+
+    # rows ordered by date; ties keep their statement order
+    def sorted(self):
+        return self.take(sorted(range(len(self)), key=self.days.__getitem__))
+
+
+    # ------------ ROW ACCESS ------------
+    # dates are written out as "day month year" strings everywhere else
+    def date_string(self, i):
+        d = date.fromordinal(self.days[i] + EPOCH_ORDINAL)
+        return f"{d.day} {d.month} {d.year}"
+
+    def amount(self, i):
+        return self.cents[i] / 100
+
+    def category(self, i):
+        return self.categories[self.category_codes[i]]
+
+    def set_category(self, i, category):
+        self.category_codes[i] = self.category_code(category)
+
+    def source(self, i):
+        code = self.source_codes[i]
+        return SOURCES[code] if code >= 0 else None
+
+    # (date, description, category, amount, source) tuples, as written to the csvs, ledger and rollups
+    def rows(self):
+        for i in range(len(self)):
+            source = self.source(i)
+            yield self.date_string(i), self.descs[i], self.category(i), self.amount(i), source.value[1] if source else None
+
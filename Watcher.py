@@ -0,0 +1,143 @@
+import ctypes, os, select, struct, time
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+EVENT = struct.Struct("iIII")
+
+# names browsers and editors give files that are still being written
+PARTIAL_SUFFIXES = (".tmp", ".part", ".crdownload", ".download", ".swp")
+
+
+# inotify through libc, so there is nothing to install. raises OSError where it is not available
+class Inotify:
+    def __init__(self, directory):
+        try:
+            self.libc = ctypes.CDLL(None, use_errno=True)
+            self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (AttributeError, TypeError) as e:
+            raise OSError(f"inotify is not available: {e}")
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.directories = {}
+        for root, _, _ in os.walk(directory):
+            self.add(root)
+
+    def add(self, directory):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"could not watch {directory}")
+        self.directories[wd] = directory
+
+    def close(self):
+        os.close(self.fd)
+
+    # paths of files finished being written within timeout seconds, or None if events were dropped
+    def read(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+
+        paths = set()
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd not in self.directories:
+                continue
+
+            path = os.path.join(self.directories[wd], os.fsdecode(name))
+            if mask & IN_ISDIR:
+                # a new bank folder: watch it, and pick up anything already copied into it
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    for root, _, files in os.walk(path):
+                        self.add(root)
+                        paths.update(os.path.join(root, filename) for filename in files)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                paths.add(path)
+        return paths
+
+
+# reports statement files in a directory (and its bank subfolders) once they have finished changing.
+# uses inotify where the platform has it, otherwise polls for files whose size and mtime have settled
+class Watcher:
+    def __init__(self, directory="statements", interval=1.0, poll=False):
+        self.directory = directory
+        self.interval = interval
+        self.inotify = None
+        # path -> (mtime, size) from the previous and last reported polls
+        self.previous = {}
+        self.reported = {}
+
+        os.makedirs(directory, exist_ok=True)
+        if not poll:
+            try:
+                self.inotify = Inotify(directory)
+            except OSError as e:
+                print(f"Falling back to polling {directory}/: {e}")
+
+    def mode(self):
+        return "inotify" if self.inotify else f"polling every {self.interval}s"
+
+    # every statement currently in the directory
+    def files(self):
+        for root, directories, filenames in os.walk(self.directory):
+            directories[:] = [d for d in directories if not d.startswith(".")]
+            for filename in filenames:
+                if self.is_statement(filename):
+                    yield os.path.join(root, filename)
+
+    def is_statement(self, filename):
+        return not filename.startswith(".") and not filename.lower().endswith(PARTIAL_SUFFIXES)
+
+    # yield sorted batches of changed statements forever, starting with everything already there
+    def changes(self):
+        yield sorted(self.files())
+        if not self.inotify:
+            self.previous = self.stats()
+            self.reported = dict(self.previous)
+
+        while True:
+            paths = self.wait()
+            if paths:
+                yield sorted(paths)
+
+    def wait(self):
+        if self.inotify:
+            paths = self.inotify.read(self.interval)
+            # the kernel dropped events, so look at everything again
+            if paths is None:
+                return set(self.files())
+            return {path for path in paths if self.is_statement(os.path.basename(path)) and os.path.isfile(path)}
+
+        time.sleep(self.interval)
+        return self.poll()
+
+    def stats(self):
+        stats = {}
+        for path in self.files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stats[path] = (stat.st_mtime_ns, stat.st_size)
+        return stats
+
+    # files whose stat changed since they were last reported and held still for a whole interval
+    def poll(self):
+        current = self.stats()
+        ready = {path for path, stat in current.items() if self.previous.get(path) == stat and self.reported.get(path) != stat}
+        for path in ready:
+            self.reported[path] = current[path]
+        self.previous = current
+        return ready
+
+    def close(self):
+        if self.inotify:
+            self.inotify.close()
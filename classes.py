@@ -1,5 +1,4 @@
 from enum import Enum
-from attr import dataclass
 
 class TransactionSource(Enum):
     C1 = (1, "C1", "Capital One")
@@ -37,11 +36,3 @@ class Month(Enum):
             if str(member.value[0]) == value or member.value[1].lower() == value or member.value[2].lower() == value:
                 return member
         raise ValueError(f"{value} is not a valid Month")
-
-    
-@dataclass
-class Transaction:
-    date: str
-    desc: str
-    category: str
-    amt: float
\ No newline at end of file
@@ -1,45 +1,337 @@
-import argparse
-from Reporter import Reporter
-from Importer import Importer
-from classes import TransactionSource
+import argparse, glob, sys
+from os.path import exists
+from classes import TransactionSource, Month
 
-def get_args():
+COMMANDS = ["import", "report", "run", "watch", "serve", "query"]
+
+# pandas, plotly and bs4 are only imported by the commands that use them,
+# so --help and import-only runs start quickly
+def get_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # bare flags (e.g. ./run -b c1 -f statement.html) keep meaning import + report
+    if argv and argv[0] not in COMMANDS and argv[0] not in ["-h", "--help"]:
+        argv = ["run"] + argv
+    
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-j', '--jobs', type=int, help='Number of worker processes for parsing statements and rendering reports (defaults to CPU count)')
+    common.add_argument('--ledger', nargs='?', const='actual/ledger.db', help='Store transactions in an indexed sqlite ledger (default: actual/ledger.db) instead of per-month csvs')
+    
+    # only the one-shot import and report pipelines are instrumented
+    timing = argparse.ArgumentParser(add_help=False)
+    timing.add_argument('--timings', metavar='PATH', help='Record wall time, call counts and peak memory per stage, statement and month, and write a json summary to PATH')
+    timing.add_argument('--profile', metavar='DIR', help='Like --timings, and also dump a cProfile per statement and month into DIR')
+    timing.add_argument('--no-memory', action='store_true', help='With --timings/--profile, skip peak memory tracking, which slows the run down')
+    
+    importing = argparse.ArgumentParser(add_help=False)
+    importing.add_argument('-b', '--bank', required=True, action='append', help='Source bank for transactions. Repeat once per -f group, or give once for all files')
+    importing.add_argument('-f', '--filepath', required=True, action='append', nargs='+', help='Filepaths or globs for transactions. Repeat to pair each group with its own -b')
+    importing.add_argument('-i', '--capital-gains', type=float, help='Capital gains amount')
+    importing.add_argument('-s', '--salary', type=float, help='Salary amount')
+    importing.add_argument('-o', '--other-income', type=float, help='Other income amount')
+    importing.add_argument('-y', '--year', type=int, help='Year for transaction')
+    importing.add_argument('--no-dedupe', action='store_true', help='Write every row even if it was imported before')
+    importing.add_argument('--stream', action='store_true', help='Parse statements row by row to keep memory flat on large exports')
+    
+    reporting = argparse.ArgumentParser(add_help=False)
+    reporting.add_argument('-t', '--trends', nargs='+', type=int, help='Also write annual trend reports for these years from the monthly rollups')
+    reporting.add_argument('--force', action='store_true', help='Rebuild reports even if their inputs have not changed')
+    reporting.add_argument('--offline', action='store_true', help='Write plotly.js once into reports/ so reports open without network access')
+    
     parser = argparse.ArgumentParser(description="Budgeting Tool")
-    parser.add_argument('-b', '--bank', required=True, help='Source bank for transactions')
-    parser.add_argument('-f', '--filepath', required=True, help='Filepath for transactions')
-    parser.add_argument('-i', '--capital-gains', type=float, help='Capital gains amount')
-    parser.add_argument('-s', '--salary', type=float, help='Salary amount')
-    parser.add_argument('-o', '--other-income', type=float, help='Other income amount')
-    parser.add_argument('-y', '--year', type=int, help='Year for transaction')
-    return parser.parse_args()
+    parser.set_defaults(timings=None, profile=None, no_memory=False)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("import", parents=[common, timing, importing], help="Import statements into actual/ without writing reports")
+    report = commands.add_parser("report", parents=[common, timing, reporting], help="Regenerate reports from already imported data")
+    report.add_argument('periods', nargs='*', type=get_period, help='Periods to report on, given as MONTH_YEAR (e.g. 11_2023) or YEAR')
+    commands.add_parser("run", parents=[common, timing, importing, reporting], help="Import statements, then write reports for every month they touch")
+    watch = commands.add_parser("watch", parents=[common, reporting], help="Keep running, importing statements as they land in a folder and rewriting the reports they touch")
+    watch.add_argument('directory', nargs='?', default='statements', help='Folder to watch; statements may sit in per-bank subfolders (default: statements)')
+    watch.add_argument('-y', '--year', type=int, help='Year for transaction')
+    watch.add_argument('--no-dedupe', action='store_true', help='Write every row even if it was imported before')
+    watch.add_argument('--stream', action='store_true', help='Parse statements row by row to keep memory flat on large exports')
+    watch.add_argument('--interval', type=float, default=1.0, help='Seconds between checks of the folder (default: 1)')
+    watch.add_argument('--poll', action='store_true', help='Poll the folder instead of using inotify')
+    serve = commands.add_parser("serve", parents=[common], help="Serve reports over local http, rendering each month the first time it is opened")
+    serve.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1)')
+    serve.add_argument('--port', type=int, default=8000, help='Port to listen on (default: 8000)')
+    serve.add_argument('--cache-mb', type=float, default=64, help='Memory for rendered pages before the least recently viewed are dropped (default: 64)')
+    serve.add_argument('--offline', action='store_true', help='Write plotly.js once into reports/ so reports open without network access')
+    query = commands.add_parser("query", parents=[common], help="Filter and summarize the full transaction history")
+    query.add_argument('--since', type=get_date, help='First date to include, as YYYY, YYYY-MM or YYYY-MM-DD')
+    query.add_argument('--until', type=get_end_date, help='Last date to include, as YYYY, YYYY-MM or YYYY-MM-DD')
+    query.add_argument('--last', type=int, metavar='MONTHS', help='Only the last MONTHS months, counting this one')
+    query.add_argument('-c', '--category', action='append', help='Only these categories, after settings.json mappings. Repeat for several')
+    query.add_argument('--min', type=float, help='Smallest amount to include')
+    query.add_argument('--max', type=float, help='Largest amount to include')
+    query.add_argument('-d', '--description', help='Only descriptions containing this text (case-insensitive)')
+    query.add_argument('-g', '--group-by', nargs='+', choices=['category', 'description', 'month', 'year', 'source'], help='Sum amounts and count rows per group')
+    query.add_argument('-n', '--top', type=int, help='Only the N largest transactions, or groups by total')
+    query.add_argument('--format', choices=['csv', 'json'], default='csv', help='Output format (default: csv)')
+    
+    args = parser.parse_args(argv)
+    if args.command == "report" and not args.periods and not args.trends:
+        report.error("give at least one period or -t/--trends")
+    if args.command == "query" and args.last and (args.since or args.until):
+        query.error("--last can't be combined with --since/--until")
+    return args
 
 
-if __name__ == "__main__":
-    args = get_args()
-    i = Importer()
-    r = Reporter()
-    
+# the (month, year) periods a MONTH_YEAR or YEAR string names
+def get_period(spec):
+    month, separator, year = spec.rpartition("_")
+    try:
+        year = int(year)
+        if year < 1:
+            raise ValueError(spec)
+        return [(Month.from_value(month), year)] if separator else [(month, year) for month in Month]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{spec}' is not a period; give MONTH_YEAR (e.g. 11_2023) or YEAR")
+
+# flatten parsed MONTH_YEAR and YEAR arguments into one list of (month, year) periods
+def get_periods(specs):
+    return [period for periods in specs for period in periods]
+
+
+# (year, month, day) for a YYYY, YYYY-MM or YYYY-MM-DD string, at the start or end of the period it names
+def get_date(spec, end=False):
+    from calendar import monthrange
+    from datetime import date
     try:
-        source = TransactionSource.from_value(args.bank)
-    except:
-        print(f"Unknown source: '{args.bank}'")
+        parts = [int(part) for part in spec.split("-")]
+        if len(parts) > 3:
+            raise ValueError(spec)
+        year = parts[0]
+        month = parts[1] if len(parts) > 1 else (12 if end else 1)
+        day = parts[2] if len(parts) > 2 else (monthrange(year, month)[1] if end else 1)
+        date(year, month, day)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{spec}' is not a date; give YYYY, YYYY-MM or YYYY-MM-DD")
+    return year, month, day
+
+def get_end_date(spec):
+    return get_date(spec, end=True)
+
+
+# pair each group of files with its bank and expand any globs
+def get_jobs(banks, filepath_groups):
+    if len(banks) == 1:
+        banks = banks * len(filepath_groups)
+    elif len(banks) != len(filepath_groups):
+        print(f"Got {len(banks)} banks for {len(filepath_groups)} file groups; give one bank, or one per -f")
         exit(1)
     
-    times = i.run(source, args.filepath, args.year, args.salary, args.capital_gains, args.other_income)
-    for month, year in times:
-        r.run(month, year)
-        print(f"Writing report for {month.value[2]}, {year}...")
+    jobs = []
+    for bank, patterns in zip(banks, filepath_groups):
+        try:
+            source = TransactionSource.from_value(bank)
+        except:
+            print(f"Unknown source: '{bank}'")
+            exit(1)
         
-    if len(times) > 0:
-        print("Done!")
+        for pattern in patterns:
+            filepaths = sorted(glob.glob(pattern)) or [pattern]
+            jobs.extend((source, filepath) for filepath in filepaths)
+    return jobs
+
+
+def get_ledger(args):
+    if not args.ledger:
+        return None
+    from LedgerStore import LedgerStore
+    return LedgerStore(args.ledger)
+
+
+# import statements, returning the (month, year) periods that received new rows
+def import_statements(args, ledger, rollups):
+    from Importer import Importer
+    i = Importer(stream=args.stream, dedupe=not args.no_dedupe, ledger=ledger, rollups=rollups)
+    if args.timings or args.profile:
+        from Categorizer import Categorizer
+        from Profiler import profiler
+        profiler.instrument(Importer, Categorizer)
+    
+    jobs = get_jobs(args.bank, args.filepath)
+    times = i.run_many(jobs, args.year, args.salary, args.capital_gains, args.other_income, args.jobs)
+    for month, year in times:
+        print(f"Imported transactions for {month.value[2]}, {year}")
+    if not times:
+        print("No new transactions to import.")
+    return times
+
+
+# write monthly reports for the given periods and any requested trend reports
+def write_reports(args, ledger, rollups, periods):
+    from Reporter import Reporter
+    r = Reporter(ledger=ledger, force=args.force, offline=args.offline, rollups=rollups)
+    if args.timings or args.profile:
+        from Profiler import profiler
+        profiler.instrument(Reporter)
+    
+    written = r.run_many(periods, args.jobs) if periods else []
+    for month, year in written:
+        print(f"Wrote report for {month.value[2]}, {year}")
     
+    for year in args.trends or []:
+        if r.create_trend_report(year):
+            written.append(year)
+            print(f"Wrote trend report for {year}")
+    return written
+
+
+# import statements as they appear in a folder, keeping the importer, reporter and settings warm between files
+def watch_statements(args, ledger, rollups):
+    from Watcher import Watcher
+    from BuildManifest import BuildManifest
+    from Importer import Importer
+    from Reporter import Reporter
+    
+    # the watch loop is latency bound, so work stays in this warm process unless -j asks otherwise
+    workers = args.jobs or 1
+    importer = Importer(stream=args.stream, dedupe=not args.no_dedupe, ledger=ledger, rollups=rollups)
+    reporter = Reporter(ledger=ledger, force=args.force, offline=args.offline, rollups=rollups)
+    settings_hash = BuildManifest.hash_file("settings.json")
+    # content hash of every statement already handled, so restarts and touched-but-unchanged files are skipped
+    handled = BuildManifest(f"{args.directory}/.watched.json")
+    watcher = Watcher(args.directory, args.interval, args.poll)
+    print(f"Watching {args.directory}/ ({watcher.mode()}), press Ctrl+C to stop")
+    
+    try:
+        for paths in watcher.changes():
+            jobs, hashes = [], {}
+            for path in paths:
+                file_hash = BuildManifest.hash_file(path)
+                if file_hash is None or handled.entries.get(path) == file_hash:
+                    continue
+                source = importer.detect_source(path)
+                if source is None:
+                    print(f"Skipping {path}: could not tell which bank it is from")
+                    continue
+                jobs.append((source, path))
+                hashes[path] = file_hash
+            if not jobs:
+                continue
+            
+            # new rules, mappings or budget take effect without a restart
+            if BuildManifest.hash_file("settings.json") != settings_hash:
+                settings_hash = BuildManifest.hash_file("settings.json")
+                importer.categorizer = None
+                reporter = Reporter(ledger=ledger, force=args.force, offline=args.offline, rollups=rollups)
+            
+            for source, path in jobs:
+                print(f"Importing {path} ({source.value[2]})")
+            # previously imported rows are dropped by the fingerprint index, so only new content is written.
+            # a statement that fails is left out of the handled list, so saving it again retries it
+            times, imported = import_watched(importer, jobs, args.year, workers)
+            for path in imported:
+                handled.record(path, hashes[path])
+            handled.save()
+            
+            try:
+                for month, year in reporter.run_many(times, workers) if times else []:
+                    print(f"Wrote report for {month.value[2]}, {year}")
+            except Exception as error:
+                print(f"Failed to write reports for {', '.join(imported)}: {error!r}")
+            for year in sorted({year for _, year in times} & set(args.trends or [])):
+                try:
+                    if reporter.create_trend_report(year):
+                        print(f"Wrote trend report for {year}")
+                except Exception as error:
+                    print(f"Failed to write trend report for {year}: {error!r}")
+    except KeyboardInterrupt:
+        print("Stopped watching")
+    finally:
+        watcher.close()
+    return []
+
+
+# import a batch of watched statements, returning the periods that received rows and the paths imported.
+# if the batch fails its statements are retried one at a time, so a bad file only loses itself
+def import_watched(importer, jobs, year, workers):
+    try:
+        return importer.run_many(jobs, year, None, None, None, workers), [path for _, path in jobs]
+    except Exception as error:
+        if len(jobs) == 1:
+            print(f"Failed to import {jobs[0][1]}: {error!r}")
+            return [], []
     
+    times, imported = [], []
+    for job in jobs:
+        job_times, job_imported = import_watched(importer, [job], year, workers)
+        times.extend(period for period in job_times if period not in times)
+        imported.extend(job_imported)
+    return times, imported
+
+
+# stream matching transactions or group totals to stdout as csv or json
+def query_transactions(args, ledger):
+    import csv, json, os
+    from datetime import date
+    from LedgerStore import LedgerStore
     
+    # without --ledger, query a sqlite mirror of the csvs that only reloads months whose csv changed
+    if ledger is None:
+        ledger = LedgerStore("actual/index.db")
+        ledger.sync()
     
+    start, end = args.since, args.until
+    if args.last:
+        today = date.today()
+        months_back = today.year * 12 + today.month - 1 - (args.last - 1)
+        start = (months_back // 12, months_back % 12 + 1, 1)
     
+    mappings = {}
+    if exists("settings.json"):
+        with open("settings.json", "r") as file:
+            mappings = json.load(file).get("Mappings", {})
     
+    columns, rows = ledger.query(start, end, args.category, args.min, args.max, args.description, args.group_by, args.top, mappings)
+    try:
+        if args.format == "csv":
+            writer = csv.writer(sys.stdout)
+            writer.writerow(columns)
+            writer.writerows(rows)
+        else:
+            sys.stdout.write("[")
+            for i, row in enumerate(rows):
+                sys.stdout.write(("," if i else "") + "\n" + json.dumps(dict(zip(columns, row))))
+            sys.stdout.write("\n]\n")
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # the reader (e.g. head) stopped early; point stdout at devnull so the exit flush doesn't fail too
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
+
+if __name__ == "__main__":
+    args = get_args()
+    if args.timings or args.profile:
+        from Profiler import profiler
+        # stages are only broken down per statement and month when they run in this process
+        profiler.enable(memory=not args.no_memory, cprofile_dir=args.profile)
+        args.jobs = 1
     
+    from RollupCache import RollupCache
+    ledger = get_ledger(args)
+    rollups = RollupCache()
     
+    done = []
+    match args.command:
+        case "import":
+            done = import_statements(args, ledger, rollups)
+        case "report":
+            done = write_reports(args, ledger, rollups, get_periods(args.periods))
+        case "run":
+            done = write_reports(args, ledger, rollups, import_statements(args, ledger, rollups))
+        case "watch":
+            done = watch_statements(args, ledger, rollups)
+        case "query":
+            query_transactions(args, ledger)
+        case "serve":
+            from ReportServer import ReportServer
+            ReportServer(ledger=ledger, offline=args.offline, cache_bytes=int(args.cache_mb * 2**20)).serve(args.host, args.port)
     
+    if args.timings or args.profile:
+        profiler.report()
+        profiler.save(args.timings or f"{args.profile}/timings.json")
     
-    
\ No newline at end of file
+    if len(done) > 0:
+        print("Done!")
@@ -0,0 +1,15 @@
+import os, shutil, sys
+import pytest
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO)
+
+
+# a scratch directory laid out like the repo, made the working directory for the test
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    for folder in ["actual", "goals", "reports", "statements"]:
+        (tmp_path / folder).mkdir()
+    shutil.copy(os.path.join(REPO, "settings.json"), tmp_path / "settings.json")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
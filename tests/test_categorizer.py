@@ -0,0 +1,72 @@
+import json
+from datetime import date
+from Categorizer import Categorizer
+from TransactionBatch import TransactionBatch
+from classes import TransactionSource
+
+
+def categorizer(workdir, rules):
+    with open(workdir / "rules.json", "w") as out_file:
+        json.dump({"Rules": rules}, out_file)
+    return Categorizer(settings=str(workdir / "rules.json"))
+
+
+def categorize(categorizer, *rows):
+    batch = TransactionBatch()
+    for desc, amt, source in rows:
+        batch.append(date(2023, 3, 1), desc, "Bank", amt, source)
+    categorizer.apply(batch)
+    return [batch.category(i) for i in range(len(batch))]
+
+
+# a regex rule listed first wins over a literal that matches at the same position
+def test_earlier_regex_beats_later_literal_at_same_position(workdir):
+    rules = [
+        {"category": "Rideshare", "regex": r"UBER\s+\*TRIP"},
+        {"category": "Food", "contains": "UBER"},
+    ]
+    assert categorize(categorizer(workdir, rules), ("UBER   *TRIP", 12.0, None), ("UBER EATS", 30.0, None)) == ["Rideshare", "Food"]
+
+
+# a rule for another bank does not hide a generic rule matching at the same position
+def test_other_bank_rule_does_not_hide_generic_rule(workdir):
+    rules = [
+        {"category": "Merchandise", "regex": "AMAZON", "bank": "C1"},
+        {"category": "Shopping", "regex": r"AMAZON\.COM"},
+    ]
+    assert categorize(categorizer(workdir, rules),
+        ("AMAZON.COM*2K", 20.0, TransactionSource.DISC),
+        ("AMAZON.COM*2K", 20.0, TransactionSource.C1),
+    ) == ["Shopping", "Merchandise"]
+
+
+# amount bounds are checked per row, falling through to the next rule when they do not fit
+def test_amount_bounds_fall_through(workdir):
+    rules = [
+        {"category": "Other Travel", "contains": "DELTA AIR", "min": 100},
+        {"category": "Fees", "contains": "DELTA"},
+    ]
+    assert categorize(categorizer(workdir, rules), ("DELTA AIR LINES", 250.0, None), ("DELTA AIR LINES", 30.0, None)) == ["Other Travel", "Fees"]
+
+
+# regexes are only tried on descriptions holding the literal they start with; those without one still run
+def test_regexes_with_and_without_literal_starts(workdir):
+    rules = [
+        {"category": "Transfers", "regex": r"(?:PAYPAL|VENMO) \*\w+"},
+        {"category": "Shopping", "regex": r"AMAZON\.?COM?"},
+        {"category": "Optional", "regex": r"COLOU?R LAB"},
+        {"category": "Inline", "regex": r"(?i)^sq \*"},
+    ]
+    assert categorize(categorizer(workdir, rules),
+        ("VENMO *JANE", 10.0, None), ("amazon.co", 10.0, None), ("AMAZONCOM", 10.0, None),
+        ("COLOR LAB", 10.0, None), ("SQ *COFFEE", 10.0, None), ("PAYPAL JANE", 10.0, None),
+    ) == ["Transfers", "Shopping", "Shopping", "Optional", "Inline", "Bank"]
+
+
+# a literal starting inside another literal's match, and one found twice, still match
+def test_overlapping_literals(workdir):
+    rules = [
+        {"category": "Second", "contains": "CHIPS"},
+        {"category": "First", "contains": "FISH AND CHIP"},
+    ]
+    assert categorize(categorizer(workdir, rules), ("FISH AND CHIPS", 10.0, None), ("FISH AND CHIP FISH AND CHIPS", 10.0, None)) == ["Second", "Second"]
@@ -0,0 +1,144 @@
+import csv, shutil, subprocess, sys
+from glob import glob
+from pathlib import Path
+from conftest import REPO
+from Importer import Importer
+from StatementGenerator import StatementGenerator
+from classes import TransactionSource
+
+
+# every exported row across the month csvs, as a sorted list so repeats still count
+def month_rows():
+    rows = []
+    for filepath in sorted(glob("actual/*.csv")):
+        with open(filepath, newline="") as in_file:
+            rows.extend(tuple(row) for row in csv.reader(in_file) if row[0] != "Date")
+    return sorted(rows)
+
+
+def run_import():
+    return Importer().run(TransactionSource.DISC, "statements/disc.html", 2023, None, None, None)
+
+
+def test_reimport_skips_imported_rows(workdir):
+    StatementGenerator(1).write_disc("statements/disc.html", 200, 2023)
+    run_import()
+    first = month_rows()
+    assert run_import() == []
+    assert month_rows() == first
+
+
+# an importer killed after renaming a month csv into place but before saving that month's fingerprints
+# must not lead the next import to write the same rows again
+def test_crash_between_csv_commit_and_index_save(workdir, monkeypatch):
+    StatementGenerator(1).write_disc("statements/disc.html", 200, 2023)
+    shutil.copytree(workdir, workdir / "clean")
+    monkeypatch.chdir(workdir / "clean")
+    run_import()
+    expected = month_rows()
+    monkeypatch.chdir(workdir)
+
+    crash = (
+        f"import os, sys; sys.path.insert(0, {REPO!r})\n"
+        "from FingerprintIndex import FingerprintIndex\n"
+        "FingerprintIndex.save = lambda self: os._exit(3)\n"
+        "from Importer import Importer\n"
+        "from classes import TransactionSource\n"
+        "Importer().run(TransactionSource.DISC, 'statements/disc.html', 2023, None, None, None)\n"
+    )
+    assert subprocess.run([sys.executable, "-c", crash]).returncode == 3
+    assert len(glob("actual/*.csv")) == 1 and len(glob("actual/.*.fingerprints.pending")) == 1
+
+    run_import()
+    assert not glob("actual/.*.pending")
+    assert month_rows() == expected
+
+
+def test_ledger_import_after_csv_import(workdir):
+    from LedgerStore import LedgerStore
+    StatementGenerator(1).write_disc("statements/disc.html", 200, 2023)
+    run_import()
+    ledger = LedgerStore("actual/ledger.db")
+    Importer(ledger=ledger).run(TransactionSource.DISC, "statements/disc.html", 2023, None, None, None)
+    stored = sorted((date, desc, category, str(amount)) for month, year in ledger.periods() for date, desc, category, amount, _ in ledger.rows(month, year))
+    assert stored == month_rows()
+    assert Importer(ledger=ledger).run(TransactionSource.DISC, "statements/disc.html", 2023, None, None, None) == []
+
+
+def test_corrected_salary_replaces_income_row(workdir):
+    from LedgerStore import LedgerStore
+    from RollupCache import RollupCache
+    StatementGenerator(1).write_disc("statements/disc.html", 50, 2023)
+    ledger, rollups = LedgerStore("actual/ledger.db"), RollupCache("actual/rollups.db")
+    for importer in [Importer(rollups=rollups), Importer(ledger=ledger)]:
+        importer.run(TransactionSource.DISC, "statements/disc.html", 2023, 5000, None, None)
+        importer.run(TransactionSource.DISC, "statements/disc.html", 2023, 5500, None, None)
+        assert importer.run(TransactionSource.DISC, "statements/disc.html", 2023, 5500, None, None) == []
+
+    salaries = [row for row in month_rows() if row[2] == "Salary"]
+    assert salaries and all(amount == "5500" for _, _, _, amount in salaries)
+    assert len(salaries) == len(glob("actual/*.csv"))
+    for month, year in ledger.periods():
+        assert [amount for _, _, category, amount, _ in ledger.rows(month, year) if category == "Salary"] == [5500]
+    salary_rollups = rollups.conn.execute("SELECT amount, count FROM rollups WHERE category = 'Salary'").fetchall()
+    assert salary_rollups and set(salary_rollups) == {(5500, 1)}
+
+
+# a legacy csv holding the same income kind more than once loses every one of those rows to the upsert,
+# and its rollups with them
+def test_corrected_salary_over_duplicate_income_rows(workdir):
+    from RollupCache import RollupCache
+    StatementGenerator(1).write_disc("statements/disc.html", 50, 2023)
+    rollups = RollupCache("actual/rollups.db")
+    Importer(rollups=rollups).run(TransactionSource.DISC, "statements/disc.html", 2023, 5000, None, None)
+    for filepath in glob("actual/*.csv"):
+        with open(filepath, "a", newline="") as out_file:
+            csv.writer(out_file).writerow(["", "Salary", "Salary", "5000"])
+
+    Importer(rollups=rollups).run(TransactionSource.DISC, "statements/disc.html", 2023, 5500, None, None)
+    assert [amount for _, _, category, amount in month_rows() if category == "Salary"] == ["5500"] * len(glob("actual/*.csv"))
+    assert set(rollups.conn.execute("SELECT amount, count FROM rollups WHERE category = 'Salary'").fetchall()) == {(5500, 1)}
+
+
+# csv rows migrated into a ledger keep the fingerprints their imports recorded, so importing the same
+# statement again adds nothing to the ledger or the rollups
+def test_reimport_after_migrate(workdir):
+    from LedgerStore import LedgerStore
+    from RollupCache import RollupCache
+    StatementGenerator(1).write_disc("statements/disc.html", 200, 2023)
+    rollups = RollupCache("actual/rollups.db")
+    Importer(rollups=rollups).run(TransactionSource.DISC, "statements/disc.html", 2023, None, None, None)
+    ledger = LedgerStore("actual/ledger.db")
+    ledger.migrate()
+    count = ledger.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    assert Importer(ledger=ledger, rollups=rollups).run(TransactionSource.DISC, "statements/disc.html", 2023, None, None, None) == []
+    assert ledger.conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0] == count == len(month_rows())
+    assert rollups.conn.execute("SELECT SUM(count) FROM rollups").fetchone()[0] == count
+
+
+# month csvs written before per-month indexes existed have one built from their rows on the next import,
+# matching on date, description and amount since the csvs do not record the bank
+def test_reimport_over_csvs_without_index(workdir):
+    StatementGenerator(1).write_disc("statements/disc.html", 200, 2023)
+    run_import()
+    first = month_rows()
+    for filepath in glob("actual/.*.fingerprints"):
+        Path(filepath).unlink()
+
+    assert run_import() == []
+    assert month_rows() == first
+    assert len(glob("actual/.*.fingerprints")) == len(glob("actual/*.csv"))
+    assert run_import() == []
+
+
+# a bank with an html adapter can still send ofx, qfx and csv downloads, which are read by their format
+def test_downloads_from_html_banks(workdir):
+    generator = StatementGenerator(1)
+    generator.write_bofa("statements/c1_dl.qfx", 30, 2023)
+    generator.write_sofi("statements/disc_dl.csv", 30, 2023)
+    importer = Importer()
+    for source, filepath in [(TransactionSource.C1, "statements/c1_dl.qfx"), (TransactionSource.DISC, "statements/disc_dl.csv")]:
+        batches = importer.extract(source, filepath, 2023)
+        assert sum(len(batch) for batch in batches.values()) > 0
+        assert {batch.source(i) for batch in batches.values() for i in range(len(batch))} == {source}
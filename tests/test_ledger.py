@@ -0,0 +1,107 @@
+import os, sqlite3
+import pytest
+import main
+from LedgerStore import LedgerStore
+from test_reporter import write_month
+
+
+def descriptions(ledger, contains):
+    _, rows = ledger.query(contains=contains)
+    return sorted(row[1] for row in rows)
+
+
+# months whose csv was removed since the last sync are dropped from the mirror
+def test_sync_drops_months_whose_csv_is_gone(workdir):
+    write_month(1, 2023, [("3 1 2023", "GROCER", "Supermarkets", "40.0")])
+    write_month(2, 2023, [("5 2 2023", "GAS", "Gasoline", "25.0")])
+    ledger = LedgerStore("actual/index.db")
+    assert ledger.sync() == [(1, 2023), (2, 2023)]
+
+    os.remove("actual/1_2023.csv")
+    assert ledger.sync() == [(1, 2023)]
+    assert ledger.periods() == [(2, 2023)]
+    assert ledger.fingerprints(1, 2023) == set()
+    assert ledger.sync() == []
+
+
+# a sync with no csv rewritten hashes none of them, and one touched without changing is not reloaded
+def test_sync_hashes_only_csvs_whose_stat_moved(workdir, monkeypatch):
+    from BuildManifest import BuildManifest
+    write_month(1, 2023, [("3 1 2023", "GROCER", "Supermarkets", "40.0")])
+    ledger = LedgerStore("actual/index.db")
+    assert ledger.sync() == [(1, 2023)]
+
+    hashed = []
+    hash_file = BuildManifest.hash_file
+    monkeypatch.setattr(BuildManifest, "hash_file", staticmethod(lambda filepath: hashed.append(filepath) or hash_file(filepath)))
+    assert ledger.sync() == [] and hashed == []
+    os.utime("actual/1_2023.csv", ns=(0, 0))
+    assert ledger.sync() == [] and hashed == ["actual/1_2023.csv"]
+    assert ledger.sync() == [] and len(hashed) == 1
+
+
+# description search goes through the trigram index, matches substrings case-insensitively,
+# and follows rows as they are replaced
+def test_description_search(workdir):
+    write_month(1, 2023, [
+        ("3 1 2023", "AMAZON.COM*2K4", "Merchandise", "40.0"),
+        ("4 1 2023", "Amazon Prime", "Merchandise", "15.0"),
+        ("5 1 2023", "100% JUICE", "Dining", "5.0"),
+    ])
+    ledger = LedgerStore("actual/index.db")
+    ledger.sync()
+    assert descriptions(ledger, "amazon") == ["AMAZON.COM*2K4", "Amazon Prime"]
+    assert descriptions(ledger, "ON.COM*") == ["AMAZON.COM*2K4"]
+    assert descriptions(ledger, "0%") == ["100% JUICE"]
+    plan = " ".join(str(row) for row in ledger.conn.execute("EXPLAIN QUERY PLAN SELECT * FROM transactions WHERE rowid IN (SELECT rowid FROM transactions_search WHERE transactions_search MATCH '\"amazon\"')"))
+    assert "VIRTUAL TABLE INDEX" in plan
+
+    ledger.replace(1, 2023, [("3 1 2023", "TARGET", "Merchandise", "40.0", None)])
+    assert descriptions(ledger, "amazon") == []
+    assert descriptions(ledger, "target") == ["TARGET"]
+
+
+# ledgers made before the search index have it built from their rows when opened
+def test_search_index_built_for_existing_ledger(workdir):
+    conn = sqlite3.connect("actual/ledger.db")
+    conn.execute("CREATE TABLE transactions (year INTEGER NOT NULL, month INTEGER NOT NULL, day INTEGER, description TEXT NOT NULL, category TEXT NOT NULL, amount REAL NOT NULL, source TEXT)")
+    conn.execute("INSERT INTO transactions VALUES (2023, 1, 3, 'SHELL OIL 123', 'Gasoline', 30.0, 'Disc')")
+    conn.commit()
+    conn.close()
+    assert descriptions(LedgerStore(), "shell") == ["SHELL OIL 123"]
+
+
+# mirrors synced before csv stats were kept reload nothing, only hashing their csvs once more
+def test_sync_over_mirror_without_stats(workdir):
+    write_month(1, 2023, [("3 1 2023", "GROCER", "Supermarkets", "40.0")])
+    LedgerStore("actual/index.db").sync()
+    conn = sqlite3.connect("actual/index.db")
+    conn.executescript("ALTER TABLE synced_csvs DROP COLUMN stat")
+    conn.close()
+    ledger = LedgerStore("actual/index.db")
+    assert ledger.sync() == []
+    assert ledger.conn.execute("SELECT stat FROM synced_csvs").fetchone()[0] is not None
+
+
+@pytest.mark.parametrize("spec", ["2023-13", "2023-02-30", "last week", "2023-01-01-01"])
+def test_query_rejects_bad_dates(spec, capsys):
+    with pytest.raises(SystemExit):
+        main.get_args(["query", "--since", spec])
+    assert f"argument --since: '{spec}' is not a date" in capsys.readouterr().err
+
+
+def test_query_date_bounds():
+    args = main.get_args(["query", "--since", "2023-02", "--until", "2024-02"])
+    assert (args.since, args.until) == ((2023, 2, 1), (2024, 2, 29))
+
+
+@pytest.mark.parametrize("spec", ["13_2023", "foo", "11_", "_2023", "11_20x3"])
+def test_report_rejects_bad_periods(spec, capsys):
+    with pytest.raises(SystemExit):
+        main.get_args(["report", spec])
+    assert f"argument periods: '{spec}' is not a period" in capsys.readouterr().err
+
+
+def test_report_periods():
+    args = main.get_args(["report", "11_2023", "nov_2024", "2022"])
+    assert main.get_periods(args.periods) == [(main.Month.NOV, 2023), (main.Month.NOV, 2024)] + [(month, 2022) for month in main.Month]
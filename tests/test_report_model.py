@@ -0,0 +1,67 @@
+import pandas as pd
+from classes import Month
+import Reporter as reporter_module
+from Reporter import Reporter
+from test_reporter import write_month
+
+
+def write_months():
+    write_month(3, 2023, [
+        ("2 3 2023", "GROCER", "Supermarkets", "40.0"),
+        ("9 3 2023", "GROCER", "Supermarkets", "60.5"),
+        ("4 3 2023", "CAFE", "Restaurants", "12.25"),
+        ("", "Salary", "Salary", "5000"),
+    ])
+    write_month(4, 2023, [("1 4 2023", "GAS", "Gasoline", "30.0"), ("", "Salary", "Salary", "5100")])
+
+
+def test_build_model_totals(workdir):
+    write_months()
+    reporter = Reporter()
+    model = reporter.build_model(Month.MAR, 2023, reporter.load_actual(Month.MAR, 2023))
+
+    # bank categories come out under their settings.json mappings
+    mapped = reporter.category_mappings
+    assert model.actual_spend.to_dict() == {mapped.get("Supermarkets", "Supermarkets"): 100.5, mapped.get("Restaurants", "Restaurants"): 12.25}
+    assert model.actual_income.to_dict() == {"Salary": 5000.0}
+    assert (model.total_actual_spend, model.total_actual_income) == (112.75, 5000.0)
+    assert model.total_target_spend == reporter.load_target(Month.MAR, 2023)[2]["Amount"].sum()
+    assert model.cumulative.tolist() == [40.0, 52.25, 112.75] and model.total_spend == 112.75
+    assert model.days_in_month == 31
+
+
+# the totals run_many sums once for the whole range give each month the same model as its own groupby
+def test_range_totals_match_month_totals(workdir):
+    write_months()
+    reporter = Reporter()
+    actual = reporter.map_categories(reporter.load_actual_range([(Month.MAR, 2023), (Month.APR, 2023)]))
+    totals = actual.groupby(["Year", "Month", "Category"])["Amount"].sum()
+    for (year, month), part in reporter.partition(actual).items():
+        sliced = reporter.build_model(Month.from_value(month), year, part, totals.loc[(year, month)])
+        own = reporter.build_model(Month.from_value(month), year, part)
+        pd.testing.assert_frame_equal(sliced.comparison, own.comparison)
+        assert sliced.total_actual_spend == own.total_actual_spend
+
+    assert reporter.run_many([(Month.MAR, 2023), (Month.APR, 2023)], workers=1) == [(Month.MAR, 2023), (Month.APR, 2023)]
+
+
+# a forecast's year target reads every month's goals, so another month's goals file is one of its inputs
+def test_forecast_inputs_cover_year_goals(workdir):
+    write_months()
+    before = Reporter().report_inputs(Month.MAR, 2023)
+    with open("goals/7_2023.csv", "w") as out_file:
+        out_file.write("Category,Amount\nSupermarkets,900\n")
+    after = Reporter().report_inputs(Month.MAR, 2023)
+    assert before["year_target"] != after["year_target"] and before["actual"] == after["actual"]
+
+
+# render workers read the same ledger and the rollups their parent already refreshed
+def test_render_workers_share_ledger_and_rollups(workdir):
+    from LedgerStore import LedgerStore
+    write_months()
+    reporter = Reporter(ledger=LedgerStore("actual/ledger.db"))
+    reporter.report_inputs(Month.MAR, 2023)
+    reporter_module.init_render_worker(False, reporter.ledger.filepath, reporter.rollups.filepath)
+    worker = reporter_module._render_worker
+    assert worker.ledger.filepath == "actual/ledger.db" and worker.rollups.filepath == reporter.rollups.filepath
+    assert worker.rollups_refreshed
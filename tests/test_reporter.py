@@ -0,0 +1,43 @@
+import csv
+import pandas as pd
+from Reporter import Reporter
+from RollupCache import RollupCache, csv_source
+
+
+def write_month(month, year, rows):
+    with open(f"actual/{month}_{year}.csv", "w", newline="") as out_file:
+        writer = csv.writer(out_file)
+        writer.writerow(["Date", "Description", "Category", "Amount"])
+        writer.writerows(rows)
+
+
+# months exported before rollups were kept are computed the first time the rollups are read
+def test_trend_report_backfills_months_without_rollups(workdir):
+    write_month(1, 2023, [("3 1 2023", "GROCER", "Supermarkets", "40.0"), ("9 1 2023", "GROCER", "Supermarkets", "60.0")])
+    write_month(2, 2023, [("5 2 2023", "GAS", "Gasoline", "25.0")])
+    rollups = RollupCache()
+    rollups.replace(2, 2023, [("5 2 2023", "GAS", "Gasoline", "25.0")])
+
+    assert Reporter(rollups=rollups).create_trend_report(2023)
+    assert rollups.periods() == [(1, 2023), (2, 2023)]
+    totals = rollups.read_range((1, 2023), (1, 2023))
+    assert totals["Amount"].sum() == 100.0 and totals["Count"].sum() == 2
+
+
+# a month csv rewritten after its rollups were recorded, as by an importer that stopped in between,
+# is rolled up again from the csv on the next read
+def test_rollups_rebuilt_when_month_csv_drifts(workdir):
+    write_month(1, 2023, [("3 1 2023", "GROCER", "Supermarkets", "40.0")])
+    rollups = RollupCache()
+    rollups.replace(1, 2023, [("3 1 2023", "GROCER", "Supermarkets", "40.0")], csv_source("actual/1_2023.csv"))
+    write_month(1, 2023, [("3 1 2023", "GROCER", "Supermarkets", "40.0"), ("8 1 2023", "GAS", "Gasoline", "25.0")])
+
+    totals = Reporter(rollups=rollups).get_rollups().read_range((1, 2023), (1, 2023))
+    assert totals["Amount"].sum() == 65.0 and totals["Count"].sum() == 2
+
+
+# the window spans calendar months, so a month with no data does not pull older months into it
+def test_rolling_average_keys_on_calendar_months():
+    index = pd.MultiIndex.from_tuples([(2022, 11), (2023, 1), (2023, 5), (2023, 6)], names=["Year", "Month"])
+    rolling = Reporter.rolling_average(pd.Series([30.0, 90.0, 10.0, 20.0], index=index))
+    assert rolling.tolist() == [30.0, 60.0, 10.0, 15.0]
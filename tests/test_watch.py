@@ -0,0 +1,22 @@
+from glob import glob
+import main
+from StatementGenerator import StatementGenerator
+from Watcher import Watcher
+
+
+# a statement that fails to import is logged and left for a retry, and the watcher carries on with the next batch
+def test_watch_survives_bad_statement(workdir, monkeypatch, capsys):
+    with open("statements/bofa_broken.csv", "wb") as out_file:
+        out_file.write(b"\x89PNG\x00\xff\xfe")
+    StatementGenerator(1).write_disc("statements/disc.html", 50, 2023)
+    batches = [["statements/bofa_broken.csv"], ["statements/bofa_broken.csv", "statements/disc.html"]]
+    monkeypatch.setattr(Watcher, "changes", lambda self: iter(batches))
+
+    main.watch_statements(main.get_args(["watch", "--poll", "-y", "2023", "-j", "1"]), None, None)
+
+    output = capsys.readouterr().out
+    assert output.count("Failed to import statements/bofa_broken.csv") == 2
+    assert glob("actual/*_2023.csv") and glob("reports/*.html")
+    with open("statements/.watched.json") as in_file:
+        watched = in_file.read()
+    assert "disc.html" in watched and "bofa_broken.csv" not in watched